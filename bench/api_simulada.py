@@ -0,0 +1,243 @@
+import argparse
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+import unicodedata
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# API local que imita al backend de Dzemul para medir la app sin depender del
+# servidor real. Genera datos sintéticos (siempre los mismos para la misma
+# fecha) y simula la latencia del backend. Como el backend real con soporte
+# de formatos compactos, respeta Accept (MessagePack o JSON por columnas) y
+# Accept-Encoding: gzip; con --solo-json responde siempre JSON sin comprimir.
+# Cada respuesta lleva ETag y con If-None-Match igual contesta 304 sin cuerpo.
+# Con --ritmo-hoy van apareciendo recibos nuevos en el día de hoy (para el
+# seguimiento automático de la app, que pide solo los posteriores a
+# despues_de=<recibo>).
+#
+#   python bench/api_simulada.py --puerto 8001 --filas-dia 1700 --latencia 0.3
+#   API_URL=http://127.0.0.1:8001/ flet run src/main.py
+
+NOMBRES = ["JOSÉ", "MARÍA", "JUAN", "ANA", "LUIS", "ROSA", "PEDRO", "NOEMÍ", "RAÚL", "INÉS", "JESÚS", "MARTHA"]
+APELLIDOS = ["PÉREZ", "GÓMEZ", "CANUL", "CHAN", "PECH", "NÚÑEZ", "MAY", "UC", "KU", "CAAMAL", "HAU", "DZIB"]
+CONCEPTOS = ["PREDIAL", "AGUA POTABLE", "LICENCIA DE FUNCIONAMIENTO", "PANTEÓN", "CATASTRO", "MERCADO"]
+CUENTAS = ["4110", "4120", "4310", "4320", "4410"]
+MOTIVOS = ["CONSTRUCCIÓN", "DESLINDE", "USO DE SUELO", "ALINEAMIENTO", "NÚMERO OFICIAL"]
+
+
+def _normalizar(texto: str) -> str:
+    descompuesto = unicodedata.normalize("NFD", texto)
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).casefold()
+
+
+def _nombre(rnd: random.Random) -> str:
+    return f"{rnd.choice(NOMBRES)} {rnd.choice(APELLIDOS)} {rnd.choice(APELLIDOS)}"
+
+
+class ApiSimulada:
+    """Datos sintéticos por día y un servidor HTTP que los sirve."""
+
+    def __init__(self, filas_dia: int = 1700, latencia: float = 0.3, por_fila: float = 0.00002,
+                 compacto: bool = True, ritmo_hoy: float = 0):
+        self.filas_dia = filas_dia
+        self.latencia = latencia    # segundos fijos por petición
+        self.por_fila = por_fila    # segundos extra por fila devuelta
+        self.compacto = compacto    # negociar formato y gzip
+        self.ritmo_hoy = ritmo_hoy  # recibos nuevos por minuto en el día de hoy
+        self._inicio = time.time()
+        self.peticiones = 0
+        self.no_modificadas = 0
+        self.bytes_enviados = 0
+        self._lock = threading.Lock()
+        self._servidor = None
+
+    # --- datos ---
+
+    def recibos_dia(self, dia) -> list:
+        rnd = random.Random(f"recibos{dia.isoformat()}")
+        base = dia.toordinal() * 10000
+        filas = []
+        cantidad = self.filas_dia
+        if dia == date.today():
+            cantidad += int((time.time() - self._inicio) / 60 * self.ritmo_hoy)
+        for i in range(cantidad):
+            neto = Decimal(rnd.randint(5000, 500000)) / 100
+            filas.append({
+                "recibo": base + i,
+                "contribuyente": _nombre(rnd),
+                "concepto": rnd.choice(CONCEPTOS),
+                "fecha": dia.strftime("%y%m%d"),
+                "neto": str(neto),
+                "descuento": str((neto * rnd.choice([0, 0, 0, 5, 10]) / 100).quantize(Decimal("0.01"))),
+                "cuenta": rnd.choice(CUENTAS),
+                "status": "1" if rnd.random() < 0.03 else "0",
+            })
+        return filas
+
+    def cedulas_dia(self, dia) -> list:
+        rnd = random.Random(f"cedulas{dia.isoformat()}")
+        base = dia.toordinal() * 1000
+        filas = []
+        for i in range(max(1, self.filas_dia // 10)):
+            pagada = rnd.random() < 0.7
+            filas.append({
+                "folio": base + i,
+                "motivo": rnd.choice(MOTIVOS),
+                "folio_electronico": f"FE-{base + i}" if rnd.random() < 0.5 else None,
+                "contribuyente": _nombre(rnd),
+                "direccion": f"CALLE {rnd.randint(1, 60)} #{rnd.randint(1, 999)}",
+                "fecham": dia.strftime("%y%m%d"),
+                "precio_unitario": str(Decimal(rnd.randint(10000, 300000)) / 100),
+                "cantidad": rnd.choice([1, 1, 1, 2]),
+                "recibo_teso": dia.toordinal() * 10000 + i if pagada else None,
+                "fecha_rteso": dia.strftime("%y%m%d") if pagada else None,
+            })
+        return filas
+
+    def _rango(self, generador, params) -> list:
+        desde = datetime.strptime(params["desde"], "%y%m%d").date()
+        hasta = datetime.strptime(params["hasta"], "%y%m%d").date()
+        filas = []
+        while desde <= hasta:
+            filas.extend(generador(desde))
+            desde += timedelta(days=1)
+        contribuyente = _normalizar(params.get("contribuyente", ""))
+        if contribuyente:
+            filas = [f for f in filas if contribuyente in _normalizar(f["contribuyente"])]
+        return filas
+
+    def _posteriores(self, filas, params) -> list:
+        if "despues_de" in params:
+            return [f for f in filas if f["recibo"] > int(params["despues_de"])]
+        return filas
+
+    def responder(self, endpoint: str, params: dict):
+        if endpoint in ("recibos", "recibos/filtrar"):
+            datos = self._posteriores(self._rango(self.recibos_dia, params), params)
+        elif endpoint in ("cedulas", "cedulas/filtrar"):
+            datos = self._rango(self.cedulas_dia, params)
+        elif endpoint == "recibos/totales":
+            filas = self._rango(self.recibos_dia, params)
+            vigentes = [f for f in filas if f["status"] != "1"]
+            datos = {
+                "total_neto": float(sum(Decimal(f["neto"]) for f in vigentes)),
+                "total_descuento": float(sum(Decimal(f["descuento"]) for f in vigentes)),
+                "cantidad_status_1": len(filas) - len(vigentes),
+            }
+        elif endpoint == "recibos/totales/despliegue":
+            por_cuenta = {}
+            for f in self._rango(self.recibos_dia, params):
+                if f["status"] != "1":
+                    neto, descuento = por_cuenta.get(f["cuenta"], (Decimal(0), Decimal(0)))
+                    por_cuenta[f["cuenta"]] = (neto + Decimal(f["neto"]), descuento + Decimal(f["descuento"]))
+            datos = [{"cuenta": c, "total_neto": float(n), "total_descuento": float(d)}
+                     for c, (n, d) in sorted(por_cuenta.items())]
+        else:
+            return 404, {"detail": "No encontrado"}
+
+        if isinstance(datos, list) and "limit" in params:
+            offset = int(params.get("offset", 0))
+            datos = datos[offset:offset + int(params["limit"])]
+        return 200, datos
+
+    # --- formato ---
+
+    def codificar(self, datos, aceptado: str, codificaciones: str):
+        # (cuerpo, Content-Type, Content-Encoding o None)
+        tipo = "application/json"
+        if self.compacto and isinstance(datos, list) and datos:
+            columnas = list(datos[0])
+            por_columnas = {"columnas": columnas, "filas": [[f.get(c) for c in columnas] for f in datos]}
+            if "application/x-msgpack" in aceptado and msgpack is not None:
+                datos, tipo = por_columnas, "application/x-msgpack"
+            elif "application/vnd.dzemul.columnas+json" in aceptado:
+                datos, tipo = por_columnas, "application/vnd.dzemul.columnas+json"
+        if tipo == "application/x-msgpack":
+            cuerpo = msgpack.packb(datos)
+        else:
+            cuerpo = json.dumps(datos, separators=(",", ":") if tipo != "application/json" else None).encode()
+        if self.compacto and "gzip" in codificaciones:
+            return gzip.compress(cuerpo, compresslevel=5, mtime=0), tipo, "gzip"
+        return cuerpo, tipo, None
+
+    # --- servidor ---
+
+    def iniciar(self, puerto: int = 0) -> str:
+        api = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(url.query).items()}
+                with api._lock:
+                    api.peticiones += 1
+                try:
+                    estado, datos = api.responder(url.path.strip("/"), params)
+                except (KeyError, ValueError) as e:
+                    estado, datos = 422, {"detail": str(e)}
+                filas = len(datos) if isinstance(datos, list) else 1
+                time.sleep(api.latencia + api.por_fila * filas)
+                cuerpo, tipo, codificacion = api.codificar(datos, self.headers.get("Accept", ""),
+                                                           self.headers.get("Accept-Encoding", ""))
+                etag = f'"{hashlib.md5(cuerpo).hexdigest()}"'
+                if estado == 200 and self.headers.get("If-None-Match") == etag:
+                    with api._lock:
+                        api.no_modificadas += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                with api._lock:
+                    api.bytes_enviados += len(cuerpo)
+                self.send_response(estado)
+                self.send_header("Content-Type", tipo)
+                self.send_header("ETag", etag)
+                self.send_header("Vary", "Accept, Accept-Encoding")
+                if codificacion:
+                    self.send_header("Content-Encoding", codificacion)
+                self.send_header("Content-Length", str(len(cuerpo)))
+                self.end_headers()
+                self.wfile.write(cuerpo)
+
+            def log_message(self, *args):
+                pass
+
+        self._servidor = ThreadingHTTPServer(("127.0.0.1", puerto), Manejador)
+        self._servidor.daemon_threads = True
+        threading.Thread(target=self._servidor.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._servidor.server_address[1]}/"
+
+    def detener(self):
+        if self._servidor is not None:
+            self._servidor.shutdown()
+            self._servidor.server_close()
+            self._servidor = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API simulada de recibos y cédulas")
+    parser.add_argument("--puerto", type=int, default=8001)
+    parser.add_argument("--filas-dia", type=int, default=1700, help="recibos por día (cédulas: la décima parte)")
+    parser.add_argument("--latencia", type=float, default=0.3, help="segundos fijos por petición")
+    parser.add_argument("--por-fila", type=float, default=0.00002, help="segundos extra por fila devuelta")
+    parser.add_argument("--solo-json", action="store_true", help="sin formatos compactos ni gzip")
+    parser.add_argument("--ritmo-hoy", type=float, default=0, help="recibos nuevos por minuto en el día de hoy")
+    args = parser.parse_args()
+    api = ApiSimulada(args.filas_dia, args.latencia, args.por_fila, compacto=not args.solo_json,
+                      ritmo_hoy=args.ritmo_hoy)
+    print("API simulada en", api.iniciar(args.puerto))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        api.detener()
@@ -0,0 +1,286 @@
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+
+from api_simulada import ApiSimulada
+
+# Banco de pruebas de rendimiento: levanta la API simulada, abre la app sin
+# ventana (una Page de Flet con una conexión que solo mide lo que se enviaría
+# al cliente) y recorre los flujos de Recibos y Cédulas.
+#
+#   python bench/medir.py --dias 30 --filas-dia 1700
+#
+# Reporta, por flujo: tiempo a la primera fila pintada, tiempo hasta el
+# render completo, tiempo de cambio de página (o del siguiente lote de la
+# lista virtual), bytes enviados por page.update() y memoria pico (RSS del
+# proceso; con --memoria también el pico del heap de Python por flujo, pero
+# tracemalloc hace mucho más lentos los tiempos: conviene medir por separado)
+# y lo que tarda el botón Actualizar cuando nada cambió (revalidación con 304).
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MB = 1024 * 1024
+
+
+def _preparar_entorno(args, url_api):
+    # La app lee su configuración del entorno al importar sus módulos
+    os.environ["API_URL"] = url_api
+    os.environ["LISTA_VIRTUAL"] = "0" if args.paginas else "1"
+    # Mismo default que la app: almacén local activo salvo --sin-almacen
+    os.environ["ALMACEN_LOCAL"] = "0" if args.sin_almacen else "1"
+    os.environ["ALMACEN_RUTA"] = os.path.join(tempfile.mkdtemp(prefix="bench"), "datos.sqlite3")
+    os.environ["ESPERA_BUSQUEDA"] = "0"
+    # Sin seguimiento de hoy: su tarea no termina nunca y el harness espera todas
+    os.environ["SEGUIMIENTO_SEGUNDOS"] = "0"
+    sys.path.insert(0, os.path.join(RAIZ, "src"))
+
+
+def _clases_medicion():
+    # Se importan después de _preparar_entorno
+    import flet as ft
+    from flet.core.local_connection import LocalConnection
+    from flet.core.protocol import ClientActions, ClientMessage, CommandEncoder, PageCommandsBatchResponsePayload
+
+    class ConexionMedida(LocalConnection):
+        """Conexión sin cliente: procesa los comandos y mide lo que se enviaría."""
+
+        def __init__(self):
+            super().__init__()
+            self.page = None
+            self.envios = []        # (momento, bytes, si agrega o cambia tarjetas)
+
+        def _en_tarjeta(self, id_control) -> bool:
+            c = self.page._index.get(id_control) if self.page else None
+            while c is not None:
+                if isinstance(c, ft.Card):
+                    return True
+                c = c.parent
+            return False
+
+        def _toca_filas(self, mensajes) -> bool:
+            for m in mensajes:
+                if any(c["t"] == "card" for c in getattr(m.payload, "controls", None) or []):
+                    return True
+                if any(self._en_tarjeta(p["i"]) for p in getattr(m.payload, "props", None) or []):
+                    return True
+            return False
+
+        def _enviar(self, mensaje):
+            j = json.dumps(mensaje, cls=CommandEncoder, separators=(",", ":"))
+            mensajes = mensaje.payload if isinstance(mensaje.payload, list) else [mensaje]
+            self.envios.append((time.perf_counter(), len(j), self._toca_filas(mensajes)))
+
+        def send_command(self, session_id, command):
+            result, mensaje = self._process_command(command)
+            if mensaje:
+                self._enviar(mensaje)
+            return PageCommandsBatchResponsePayload(results=[result], error="")
+
+        def send_commands(self, session_id, commands):
+            results = []
+            mensajes = []
+            for command in commands:
+                result, mensaje = self._process_command(command)
+                if command.name in ["add", "get"]:
+                    results.append(result)
+                if mensaje:
+                    mensajes.append(mensaje)
+            if mensajes:
+                self._enviar(ClientMessage(ClientActions.PAGE_CONTROLS_BATCH, mensajes))
+            return PageCommandsBatchResponsePayload(results=results, error="")
+
+    class PaginaMedida(ft.Page):
+        """Page que guarda lo lanzado con run_task/run_thread para poder esperarlo.
+
+        Flet corre los manejadores síncronos (route_change, clics) con
+        run_thread, así que también hay que seguirlos."""
+
+        def __init__(self, conn, loop):
+            conn.page_url = "http://bench"
+            conn.page = self
+            super().__init__(conn, "bench", loop)
+            self._set_attr("route", "/", dirty=False)  # lo informaría el navegador al conectarse
+            self.tareas = []
+            self._hilos = ThreadPoolExecutor(4, thread_name_prefix="bench")
+
+        def run_task(self, handler, *args, **kwargs):
+            tarea = super().run_task(handler, *args, **kwargs)
+            self.tareas.append(tarea)
+            return tarea
+
+        def run_thread(self, handler, *args, **kwargs):
+            self.tareas.append(self._hilos.submit(handler, *args, **kwargs))
+
+        async def esperar_tareas(self):
+            while True:
+                pendientes = [t for t in self.tareas if not t.done()]
+                if not pendientes:
+                    return
+                await asyncio.gather(*(asyncio.wrap_future(t) for t in pendientes), return_exceptions=True)
+
+    return ft, ConexionMedida, PaginaMedida
+
+
+def _controles(raiz):
+    pendientes = [raiz]
+    while pendientes:
+        c = pendientes.pop()
+        yield c
+        pendientes.extend(c._get_children())
+
+
+def _buscar(raiz, predicado):
+    return next(c for c in _controles(raiz) if predicado(c))
+
+
+class Medicion:
+    def __init__(self, conn):
+        self.conn = conn
+        self.inicio = 0.0
+        self.desde_envio = 0
+
+    def empezar(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        self.desde_envio = len(self.conn.envios)
+        self.inicio = time.perf_counter()
+
+    def envios(self):
+        return self.conn.envios[self.desde_envio:]
+
+    def primera_fila(self):
+        for momento, _, filas in self.envios():
+            if filas:
+                return momento - self.inicio
+        return None
+
+    def resultado(self) -> dict:
+        envios = self.envios()
+        return {
+            "total_s": time.perf_counter() - self.inicio,
+            "primera_fila_s": self.primera_fila(),
+            "updates": len(envios),
+            "bytes_total": sum(b for _, b, _ in envios),
+            "bytes_max": max((b for _, b, _ in envios), default=0),
+            "memoria_pico_mb": tracemalloc.get_traced_memory()[1] / MB if tracemalloc.is_tracing() else None,
+        }
+
+
+async def _flujo(ft, page, medicion, vista, args):
+    # Fija el rango y pulsa Buscar; luego mide un cambio de página
+    desde = (date.today() - timedelta(days=args.dias - 1)).isoformat()
+    hasta = date.today().isoformat()
+    _buscar(vista, lambda c: getattr(c, "label", None) == "Desde").data = desde
+    _buscar(vista, lambda c: getattr(c, "label", None) == "Hasta").data = hasta
+    buscar = _buscar(vista, lambda c: getattr(c, "text", None) == "Buscar")
+
+    medicion.empezar()
+    buscar.on_click(None)
+    await page.esperar_tareas()
+    carga = medicion.resultado()
+
+    medicion.empezar()
+    if args.paginas:
+        siguiente = _buscar(vista, lambda c: str(getattr(c, "text", "")).startswith("Siguientes"))
+        siguiente.on_click(None)
+    else:
+        lista = _buscar(vista, lambda c: c._get_control_name() == "listview")
+
+        class Scroll:
+            pixels = 10 ** 9
+            max_scroll_extent = 10 ** 9
+
+        lista.on_scroll(Scroll())
+    await page.esperar_tareas()
+    carga["cambio_pagina_s"] = medicion.resultado()["total_s"]
+
+    actualizar = _buscar(vista, lambda c: getattr(c, "icon", None) == ft.Icons.REFRESH)
+    medicion.empezar()
+    actualizar.on_click(None)
+    await page.esperar_tareas()
+    repetida = medicion.resultado()
+    carga["actualizar_s"] = repetida["total_s"]
+    carga["actualizar_bytes"] = repetida["bytes_total"]
+    return carga
+
+
+async def correr(args):
+    api = ApiSimulada(args.filas_dia, args.latencia, args.por_fila, compacto=not args.solo_json)
+    _preparar_entorno(args, api.iniciar())
+    ft, ConexionMedida, PaginaMedida = _clases_medicion()
+    import main as app
+
+    if args.memoria:
+        tracemalloc.start()
+    conn = ConexionMedida()
+    page = PaginaMedida(conn, asyncio.get_running_loop())
+    medicion = Medicion(conn)
+
+    medicion.empezar()
+    await app.main(page)
+    arranque = medicion.resultado()
+    await page.esperar_tareas()
+
+    resultados = {"arranque_s": arranque["total_s"]}
+    resultados["recibos"] = await _flujo(ft, page, medicion, page.views[0], args)
+    page.go("/cedulas")
+    await page.esperar_tareas()
+    resultados["cedulas"] = await _flujo(ft, page, medicion, page.views[-1], args)
+    resultados["peticiones_api"] = api.peticiones
+    resultados["bytes_api"] = api.bytes_enviados
+    resultados["no_modificadas_api"] = api.no_modificadas
+    resultados["rss_max_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    api.detener()
+    return resultados
+
+
+def _imprimir(resultados, args):
+    modo = "páginas" if args.paginas else "lista virtual"
+    print(f"{args.dias} días x {args.filas_dia} recibos/día, latencia {args.latencia}s, {modo}, "
+          f"almacén local {'no' if args.sin_almacen else 'sí'}, {'solo JSON' if args.solo_json else 'formato compacto'}")
+    print(f"  arranque (main hasta pintar): {resultados['arranque_s'] * 1000:.0f} ms")
+    for flujo in ("recibos", "cedulas"):
+        r = resultados[flujo]
+        primera = f"{r['primera_fila_s'] * 1000:.0f} ms" if r["primera_fila_s"] is not None else "-"
+        print(f"  {flujo}:")
+        print(f"    primera fila     {primera}")
+        print(f"    render completo  {r['total_s'] * 1000:.0f} ms")
+        print(f"    cambio de página {r['cambio_pagina_s'] * 1000:.0f} ms")
+        print(f"    actualizar       {r['actualizar_s'] * 1000:.0f} ms, "
+              f"{r['actualizar_bytes'] / 1024:.0f} KiB enviados")
+        print(f"    page.update()    {r['updates']} envíos, {r['bytes_total'] / 1024:.0f} KiB "
+              f"(máx {r['bytes_max'] / 1024:.0f} KiB)")
+        if r["memoria_pico_mb"] is not None:
+            print(f"    memoria pico     {r['memoria_pico_mb']:.1f} MB (heap Python)")
+    print(f"  peticiones a la API: {resultados['peticiones_api']} ({resultados['bytes_api'] / 1024:.0f} KiB, "
+          f"{resultados['no_modificadas_api']} con 304), "
+          f"RSS máx {resultados['rss_max_mb']:.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide los flujos de Recibos y Cédulas contra la API simulada")
+    parser.add_argument("--dias", type=int, default=30, help="días del rango consultado (hasta hoy)")
+    parser.add_argument("--filas-dia", type=int, default=1700)
+    parser.add_argument("--latencia", type=float, default=0.3)
+    parser.add_argument("--por-fila", type=float, default=0.00002)
+    parser.add_argument("--paginas", action="store_true", help="vista por páginas en lugar de lista virtual")
+    parser.add_argument("--sin-almacen", action="store_true",
+                        help="sin el almacén local (SQLite), que la app usa por defecto")
+    parser.add_argument("--solo-json", action="store_true", help="la API simulada responde siempre JSON sin gzip")
+    parser.add_argument("--memoria", action="store_true",
+                        help="medir la memoria pico de cada flujo con tracemalloc (hace más lentos los tiempos)")
+    parser.add_argument("--json", action="store_true", help="imprimir los resultados como JSON")
+    args = parser.parse_args()
+
+    resultados = asyncio.run(correr(args))
+    if args.json:
+        print(json.dumps(resultados, indent=2))
+    else:
+        _imprimir(resultados, args)
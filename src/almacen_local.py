@@ -0,0 +1,231 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import cache_consultas
+import cliente_api
+import indice
+import modelos
+import tramos
+
+# Almacén local (SQLite) de recibos y cédulas para trabajar con enlaces
+# lentos o sin conexión. Los días ya cerrados se descargan una sola vez y
+# quedan guardados; el día de hoy se vuelve a pedir en cada consulta. Las
+# búsquedas por rango y contribuyente se resuelven contra la base local.
+#
+# ALMACEN_LOCAL=0 lo desactiva; ALMACEN_RUTA cambia el archivo.
+
+ACTIVO = os.getenv("ALMACEN_LOCAL", "1") == "1"
+
+
+def _ruta_default() -> str:
+    # En apps empaquetadas Flet define FLET_APP_STORAGE_DATA
+    carpeta = os.getenv("FLET_APP_STORAGE_DATA") or os.path.join(os.path.expanduser("~"), ".fletvisor")
+    os.makedirs(carpeta, exist_ok=True)
+    return os.path.join(carpeta, "datos.sqlite3")
+
+
+RUTA = os.getenv("ALMACEN_RUTA") or None
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS recibos (
+    recibo TEXT, fecha TEXT, contribuyente TEXT, concepto TEXT, cuenta TEXT,
+    neto TEXT, descuento TEXT, cancelado INTEGER, contribuyente_norm TEXT
+);
+CREATE INDEX IF NOT EXISTS recibos_fecha ON recibos (fecha);
+CREATE INDEX IF NOT EXISTS recibos_contribuyente ON recibos (contribuyente_norm);
+
+CREATE TABLE IF NOT EXISTS cedulas (
+    folio TEXT, motivo TEXT, folio_electronico TEXT, contribuyente TEXT, direccion TEXT,
+    fecham TEXT, importe TEXT, recibo_teso TEXT, fecha_rteso TEXT, contribuyente_norm TEXT
+);
+CREATE INDEX IF NOT EXISTS cedulas_fecham ON cedulas (fecham);
+CREATE INDEX IF NOT EXISTS cedulas_contribuyente ON cedulas (contribuyente_norm);
+
+CREATE TABLE IF NOT EXISTS dias_sincronizados (
+    tipo TEXT, dia TEXT, PRIMARY KEY (tipo, dia)
+);
+"""
+
+
+def _iso(d):
+    return d.isoformat() if d else None
+
+
+def _fecha(texto):
+    return date.fromisoformat(texto) if texto else None
+
+
+def _recibo_a_fila(r):
+    return (str(r.recibo), _iso(r.fecha), r.contribuyente, r.concepto, r.cuenta,
+            str(r.neto), str(r.descuento), int(r.cancelado), indice.normalizar(r.contribuyente))
+
+
+def _fila_a_recibo(f):
+    return modelos.Recibo(modelos.parse_recibo(f[0]), f[2], f[3], _fecha(f[1]), Decimal(f[5]), Decimal(f[6]), f[4], bool(f[7]))
+
+
+def _cedula_a_fila(c):
+    return (str(c.folio), c.motivo, c.folio_electronico, c.contribuyente, c.direccion, _iso(c.fecham),
+            str(c.importe), c.recibo_teso, _iso(c.fecha_rteso), indice.normalizar(c.contribuyente))
+
+
+def _fila_a_cedula(f):
+    return modelos.Cedula(f[0], f[1], f[2], f[3], f[4], _fecha(f[5]), Decimal(f[6]), f[7], _fecha(f[8]))
+
+
+# tipo -> (tabla, columna de fecha, endpoint por rango, decodificador, a_fila, de_fila)
+TIPOS = {
+    "recibos": ("recibos", "fecha", "recibos", modelos.decodificar_recibos, _recibo_a_fila, _fila_a_recibo),
+    "cedulas": ("cedulas", "fecham", "cedulas", modelos.decodificar_cedulas, _cedula_a_fila, _fila_a_cedula),
+}
+
+ENDPOINTS = {
+    "recibos": "recibos", "recibos/filtrar": "recibos",
+    "cedulas": "cedulas", "cedulas/filtrar": "cedulas",
+}
+
+
+def _dia(yymmdd: str) -> date:
+    return datetime.strptime(yymmdd, "%y%m%d").date()
+
+
+def _rangos_contiguos(dias):
+    # [d1, d2, d3, d7] -> [(d1, d3), (d7, d7)]
+    rangos = []
+    for d in dias:
+        if rangos and rangos[-1][1] + timedelta(days=1) == d:
+            rangos[-1][1] = d
+        else:
+            rangos.append([d, d])
+    return [tuple(r) for r in rangos]
+
+
+class AlmacenLocal:
+    def __init__(self, ruta: str):
+        self._con = sqlite3.connect(ruta, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.executescript(_ESQUEMA)
+        self._lock = threading.Lock()
+
+    def dias_faltantes(self, tipo: str, desde: date, hasta: date) -> list:
+        with self._lock:
+            guardados = {d for (d,) in self._con.execute(
+                "SELECT dia FROM dias_sincronizados WHERE tipo = ? AND dia BETWEEN ? AND ?",
+                (tipo, desde.isoformat(), hasta.isoformat()))}
+        dias = []
+        d = desde
+        while d <= hasta:
+            if d.isoformat() not in guardados:
+                dias.append(d)
+            d += timedelta(days=1)
+        return dias
+
+    def guardar(self, tipo: str, desde: date, hasta: date, registros, cerrado: bool):
+        # Reemplaza lo guardado para ese rango de días
+        tabla, campo, _, _, a_fila, _ = TIPOS[tipo]
+        # Filas sin fecha o fuera del rango no se podrían reemplazar después
+        filas = [a_fila(r) for r in registros
+                 if getattr(r, campo) is not None and desde <= getattr(r, campo) <= hasta]
+        marcas = "?" + ", ?" * (len(filas[0]) - 1) if filas else ""
+        with self._lock, self._con:
+            self._con.execute(f"DELETE FROM {tabla} WHERE {campo} BETWEEN ? AND ?",
+                              (desde.isoformat(), hasta.isoformat()))
+            if filas:
+                self._con.executemany(f"INSERT INTO {tabla} VALUES ({marcas})", filas)
+            if cerrado:
+                dias = []
+                d = desde
+                while d <= hasta:
+                    dias.append((tipo, d.isoformat()))
+                    d += timedelta(days=1)
+                self._con.executemany("INSERT OR REPLACE INTO dias_sincronizados VALUES (?, ?)", dias)
+
+    def leer(self, tipo: str, desde: date, hasta: date, contribuyente: str = "") -> list:
+        tabla, campo, _, _, _, de_fila = TIPOS[tipo]
+        sql = f"SELECT * FROM {tabla} WHERE {campo} BETWEEN ? AND ?"
+        args = [desde.isoformat(), hasta.isoformat()]
+        if contribuyente:
+            sql += " AND contribuyente_norm LIKE ? ESCAPE '\\'"
+            patron = indice.normalizar(contribuyente).replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            args.append(f"%{patron}%")
+        sql += f" ORDER BY {campo}, rowid"
+        with self._lock:
+            return [de_fila(f) for f in self._con.execute(sql, args)]
+
+    def _por_descargar(self, tipo: str, inicio: date, fin: date, hoy: date, forzar: bool) -> list:
+        # Rangos del tramo que hay que pedir a la API: los días cerrados que
+        # falten (o todos, si forzar) y el día de hoy
+        if forzar:
+            cerrados = []
+            d = inicio
+            while d <= min(fin, hoy - timedelta(days=1)):
+                cerrados.append(d)
+                d += timedelta(days=1)
+        else:
+            cerrados = [d for d in self.dias_faltantes(tipo, inicio, fin) if d < hoy]
+        rangos = _rangos_contiguos(cerrados)
+        if inicio <= hoy <= fin:
+            rangos.append((hoy, hoy))
+        return rangos
+
+    def _descargar(self, tipo: str, inicio: date, fin: date, hoy: date, forzar: bool) -> bool:
+        _, _, endpoint, decodificar, _, _ = TIPOS[tipo]
+        params = {"desde": inicio.strftime("%y%m%d"), "hasta": fin.strftime("%y%m%d")}
+        try:
+            # Con la caché compartida: hoy y lo que falta se revalidan con
+            # ETag (un 304 no trae cuerpo) como en las consultas sin almacén
+            registros, _ = cliente_api.get_json_compartido(endpoint, params, decodificar, forzar,
+                                                           cache_consultas.compartida())
+        except Exception as e:
+            print(f"No se pudo sincronizar {tipo} {params}:", str(e))
+            return False
+        self.guardar(tipo, inicio, fin, registros, cerrado=fin < hoy)
+        return True
+
+    def consultar(self, endpoint: str, params: dict, forzar: bool = False, al_avanzar=None, cancelado=None):
+        # Bloqueante (usar en un hilo). Devuelve (registros, completo).
+        # Lo que falta se descarga por tramos en paralelo (ver tramos.py) y
+        # se lee tramo por tramo en orden de fecha; al_avanzar(filas) recibe
+        # lo acumulado cada vez que un tramo queda listo. Si se activa el
+        # threading.Event cancelado se deja de leer y lo pendiente se descarta.
+        tipo = ENDPOINTS[endpoint]
+        desde, hasta = _dia(params["desde"]), _dia(params["hasta"])
+        contribuyente = params.get("contribuyente", "")
+        hoy = _dia(cache_consultas.hoy_yymmdd())
+        pool = tramos.ejecutor()
+        encargos = [
+            (inicio, fin, [pool.submit(self._descargar, tipo, a, b, hoy, forzar)
+                           for a, b in self._por_descargar(tipo, inicio, fin, hoy, forzar)])
+            for inicio, fin in tramos.dividir(desde, hasta)
+        ]
+
+        filas = []
+        completo = True
+        for n, (inicio, fin, descargas) in enumerate(encargos, 1):
+            if cancelado is not None and cancelado.is_set():
+                for _, _, pendientes in encargos[n - 1:]:
+                    for descarga in pendientes:
+                        descarga.cancel()
+                return filas, False
+            for descarga in descargas:
+                completo = descarga.result() and completo
+            filas.extend(self.leer(tipo, inicio, fin, contribuyente))
+            if al_avanzar is not None and n < len(encargos):
+                al_avanzar(filas[:])
+        return filas, completo
+
+
+_almacen = None
+_lock = threading.Lock()
+
+
+def obtener() -> AlmacenLocal:
+    global _almacen
+    if _almacen is None:
+        with _lock:
+            if _almacen is None:
+                _almacen = AlmacenLocal(RUTA or _ruta_default())
+    return _almacen
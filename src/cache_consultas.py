@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+import pytz
+
+# Segundos que vive cada respuesta cuando el rango incluye el día de hoy
+TTL_POR_ENDPOINT = {
+    "recibos": 60,
+    "recibos/filtrar": 60,
+    "recibos/totales": 60,
+    "recibos/totales/despliegue": 120,
+    "cedulas": 120,
+    "cedulas/filtrar": 120,
+}
+TTL_DEFAULT = 60
+# Los días ya cerrados no cambian: se pueden guardar mucho más tiempo
+TTL_HISTORICO = int(os.getenv("CACHE_TTL_HISTORICO", str(12 * 60 * 60)))
+
+# Los rangos largos se guardan por tramos (ver tramos.py): una entrada por semana
+MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "256"))
+MAX_BYTES = int(float(os.getenv("CACHE_MAX_MB", "32")) * 1024 * 1024)
+
+ZONA_HORARIA = pytz.timezone("America/Merida")
+
+
+def hoy_yymmdd() -> str:
+    return datetime.now(ZONA_HORARIA).strftime("%y%m%d")
+
+
+def clave(endpoint: str, params) -> tuple:
+    params = params or {}
+    return (endpoint, params.get("desde"), params.get("hasta"), params.get("contribuyente"))
+
+
+def ttl_para(endpoint: str, params) -> int:
+    hasta = (params or {}).get("hasta")
+    if hasta and hasta < hoy_yymmdd():
+        return TTL_HISTORICO
+    return TTL_POR_ENDPOINT.get(endpoint, TTL_DEFAULT)
+
+
+class CacheConsultas:
+    """Caché LRU con caducidad para las respuestas JSON de la API.
+
+    Si la respuesta trajo validadores (ETag / Last-Modified), al caducar la
+    entrada no se borra: queda para revalidarla con una petición condicional
+    y, si el servidor contesta 304, se vuelve a usar el mismo valor."""
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS, max_bytes: int = MAX_BYTES):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self.bytes_usados = 0
+        self._datos = OrderedDict()  # clave -> (expira, bytes en memoria, valor, validadores)
+        self._lock = threading.Lock()
+
+    def obtener(self, endpoint: str, params):
+        k = clave(endpoint, params)
+        with self._lock:
+            entrada = self._datos.get(k)
+            if entrada is None:
+                return None
+            expira, tamanio, valor, validadores = entrada
+            if expira < time.monotonic():
+                if not validadores:
+                    self._quitar(k)
+                return None
+            self._datos.move_to_end(k)
+            return valor
+
+    def para_revalidar(self, endpoint: str, params):
+        # (valor, tamanio, validadores) guardado, vigente o no; None si no hay
+        # con qué hacer una petición condicional
+        with self._lock:
+            entrada = self._datos.get(clave(endpoint, params))
+            if entrada is None or not entrada[3]:
+                return None
+            return entrada[2], entrada[1], entrada[3]
+
+    def guardar(self, endpoint: str, params, valor, tamanio: int = 0, validadores=None):
+        # Guardar el mismo valor otra vez (tras un 304) solo renueva la caducidad
+        if tamanio > self.max_bytes:
+            return
+        k = clave(endpoint, params)
+        expira = time.monotonic() + ttl_para(endpoint, params)
+        with self._lock:
+            if k in self._datos:
+                self._quitar(k)
+            self._datos[k] = (expira, tamanio, valor, validadores)
+            self.bytes_usados += tamanio
+            while len(self._datos) > self.max_entradas or self.bytes_usados > self.max_bytes:
+                self._quitar(next(iter(self._datos)))
+
+    def invalidar(self, prefijo: str = "", params=None):
+        # Sin prefijo vacía todo; con "recibos" quita recibos, recibos/totales, etc.
+        # Con params solo las entradas cuyo rango se encima con params
+        # desde..hasta (el rango completo y sus tramos), sin tocar lo que
+        # otras sesiones consultaron para otras fechas.
+        # Las entradas con validadores solo se dan por caducadas: la siguiente
+        # consulta pregunta al servidor si cambiaron.
+        def afectada(k) -> bool:
+            if not k[0].startswith(prefijo):
+                return False
+            if params is None:
+                return True
+            return k[1] is not None and k[2] is not None and \
+                k[1] <= params["hasta"] and params["desde"] <= k[2]
+
+        with self._lock:
+            for k in [k for k in self._datos if afectada(k)]:
+                _, tamanio, valor, validadores = self._datos[k]
+                if validadores:
+                    self._datos[k] = (0.0, tamanio, valor, validadores)
+                else:
+                    self._quitar(k)
+
+    def _quitar(self, k):
+        _, tamanio, _, _ = self._datos.pop(k)
+        self.bytes_usados -= tamanio
+
+    def __len__(self):
+        return len(self._datos)
+
+
+_compartida = None
+_lock_compartida = threading.Lock()
+
+
+def compartida() -> CacheConsultas:
+    # Una sola caché por proceso: en modo web todas las sesiones leen las
+    # mismas respuestas (de solo lectura) en lugar de pedir cada una la suya.
+    global _compartida
+    if _compartida is None:
+        with _lock_compartida:
+            if _compartida is None:
+                _compartida = CacheConsultas()
+    return _compartida
@@ -0,0 +1,457 @@
+from __future__ import annotations
+
+import asyncio
+import codecs
+import json
+import os
+import threading
+from concurrent.futures import Future
+from typing import TYPE_CHECKING
+
+from dotenv import load_dotenv
+
+import metricas
+import sesiones
+
+if TYPE_CHECKING:
+    import requests
+
+load_dotenv()
+
+API_URL = os.getenv("API_URL")
+
+# De dónde salen los datos: "api" (HTTP, por defecto) o "mysql" (consulta
+# directa a la base, ver origen_mysql.py). Todo lo que está encima de
+# get_json/iterar_filas (caché, agrupación de pedidos, tramos, almacén local)
+# funciona igual con cualquiera de los dos.
+ORIGEN = os.getenv("ORIGEN_DATOS", "api")
+
+# --- Configuración del cliente (se puede ajustar desde .env) ---
+TIMEOUT_CONEXION = float(os.getenv("API_TIMEOUT_CONEXION", "5"))
+TIMEOUT_LECTURA = float(os.getenv("API_TIMEOUT_LECTURA", "30"))
+REINTENTOS = int(os.getenv("API_REINTENTOS", "3"))
+BACKOFF = float(os.getenv("API_BACKOFF", "0.5"))
+TAMANIO_POOL = int(os.getenv("API_POOL", "10"))
+# Formatos compactos que se ofrecen al servidor, en orden de preferencia
+# ("msgpack", "columnas"); vacío = solo JSON. Ver formato_aceptado().
+FORMATOS = [f.strip() for f in os.getenv("API_FORMATOS", "msgpack,columnas").split(",") if f.strip()]
+
+_sesion = None
+_lock = threading.Lock()
+
+
+def obtener_sesion() -> requests.Session:
+    # Una sola sesión por proceso: mantiene vivas las conexiones (keep-alive)
+    # y la comparten las pantallas de Recibos y Cédulas.
+    # requests/urllib3 se importan aquí, con la primera consulta (que ya
+    # corre en un hilo), para no retrasar el arranque de la app.
+    global _sesion
+    if _sesion is None:
+        with _lock:
+            if _sesion is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                from urllib3.util.retry import Retry
+
+                reintentos = Retry(
+                    total=REINTENTOS,
+                    backoff_factor=BACKOFF,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(["GET"]),
+                    raise_on_status=False,
+                )
+                adaptador = HTTPAdapter(
+                    pool_connections=TAMANIO_POOL,
+                    pool_maxsize=TAMANIO_POOL,
+                    max_retries=reintentos,
+                )
+                sesion = requests.Session()
+                sesion.mount("http://", adaptador)
+                sesion.mount("https://", adaptador)
+                _sesion = sesion
+    return _sesion
+
+
+def url(endpoint: str) -> str:
+    return f"{API_URL}{endpoint}"
+
+
+TAMANIO_BLOQUE = 64 * 1024
+
+# Respuestas compactas que el servidor puede elegir (negociación por Accept).
+# Si no las conoce responde JSON normal, que sigue siendo lo predeterminado.
+# gzip no necesita nada aquí: requests ya manda Accept-Encoding y
+# descomprime al leer.
+#   columnas: {"columnas": ["recibo", ...], "filas": [[...], ...]}, los
+#             nombres de campo van una sola vez
+#   msgpack:  lo mismo (o el arreglo de objetos) en MessagePack binario;
+#             solo se ofrece si el paquete msgpack está instalado
+TIPO_JSON = "application/json"
+TIPO_COLUMNAS = "application/vnd.dzemul.columnas+json"
+TIPO_MSGPACK = "application/x-msgpack"
+
+_aceptado = None
+
+
+def formato_aceptado() -> str:
+    global _aceptado
+    if _aceptado is None:
+        tipos = []
+        for formato in FORMATOS:
+            if formato == "msgpack":
+                try:
+                    import msgpack  # noqa: F401
+                except ImportError:
+                    continue
+                tipos.append(TIPO_MSGPACK)
+            elif formato == "columnas":
+                tipos.append(TIPO_COLUMNAS)
+        calidad = [f"{t};q={1 - i / 10:.1f}" for i, t in enumerate(tipos)]
+        _aceptado = ", ".join(calidad + [f"{TIPO_JSON};q=0.5"])
+    return _aceptado
+
+
+def get(endpoint: str, params=None, stream: bool = False, encabezados=None) -> requests.Response:
+    # GET bloqueante con timeout; lanza excepción si no hay respuesta
+    return obtener_sesion().get(url(endpoint), params=params, stream=stream,
+                                headers={"Accept": formato_aceptado(), **(encabezados or {})},
+                                timeout=(TIMEOUT_CONEXION, TIMEOUT_LECTURA))
+
+
+# Revalidación: si la respuesta trae ETag o Last-Modified se guardan con el
+# resultado (ver cache_consultas) y la siguiente consulta del mismo rango se
+# hace condicional. Un 304 no trae cuerpo y se reutiliza lo guardado.
+NO_MODIFICADO = object()
+
+
+def validadores_de(response: requests.Response):
+    etag = response.headers.get("ETag")
+    modificado = response.headers.get("Last-Modified")
+    if not etag and not modificado:
+        return None
+    return {"etag": etag, "modificado": modificado}
+
+
+def encabezados_condicionales(validadores) -> dict:
+    encabezados = {}
+    if validadores:
+        if validadores.get("etag"):
+            encabezados["If-None-Match"] = validadores["etag"]
+        if validadores.get("modificado"):
+            encabezados["If-Modified-Since"] = validadores["modificado"]
+    return encabezados
+
+
+def tipo_respuesta(response: requests.Response) -> str:
+    return response.headers.get("Content-Type", TIPO_JSON).split(";")[0].strip().lower()
+
+
+def bytes_red(response: requests.Response) -> int:
+    # Bytes recibidos de la red (comprimidos, si vino con gzip)
+    try:
+        return response.raw.tell()
+    except Exception:
+        return 0
+
+
+class _LectorJSON:
+    # Lee el cuerpo de la respuesta por bloques para no armar el texto completo
+    def __init__(self, response: requests.Response):
+        self._bloques = response.iter_content(chunk_size=TAMANIO_BLOQUE)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.fin = False
+        self.bytes_leidos = 0
+
+    def leer(self):
+        try:
+            bloque = next(self._bloques)
+            self.bytes_leidos += len(bloque)
+            texto = self._utf8.decode(bloque)
+        except StopIteration:
+            texto = self._utf8.decode(b"", final=True)
+            self.fin = True
+        self.buf = self.buf[self.pos:] + texto
+        self.pos = 0
+
+    def primer_caracter(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf) or self.fin:
+                return self.buf[self.pos:self.pos + 1]
+            self.leer()
+
+    def resto(self):
+        while not self.fin:
+            self.leer()
+        return json.loads(self.buf[self.pos:])
+
+    def elementos(self):
+        # Se asume que primer_caracter() ya devolvió "["
+        self.pos += 1
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n,":
+                self.pos += 1
+            if self.pos >= len(self.buf):
+                if self.fin:
+                    raise ValueError("Arreglo JSON incompleto")
+                self.leer()
+                continue
+            if self.buf[self.pos] == "]":
+                return
+            try:
+                obj, fin = self._decoder.raw_decode(self.buf, self.pos)
+                # Un número al final del bloque puede venir cortado: pedir más
+                if fin >= len(self.buf) and not self.fin:
+                    raise ValueError("bloque incompleto")
+            except ValueError:
+                if self.fin:
+                    raise
+                self.leer()
+                continue
+            self.pos = fin
+            yield obj
+
+
+def iterar_json(response: requests.Response):
+    # Devuelve uno a uno los elementos de un arreglo JSON a medida que llegan
+    lector = _LectorJSON(response)
+    if lector.primer_caracter() != "[":
+        raise ValueError("La respuesta no es un arreglo JSON")
+    yield from lector.elementos()
+
+
+def _desde_columnas(datos):
+    # Formato por columnas -> filas como dict (generador, para no tener las
+    # dos copias a la vez). Cualquier otra cosa se devuelve igual.
+    if isinstance(datos, dict) and "columnas" in datos and "filas" in datos:
+        columnas = datos["columnas"]
+        return (dict(zip(columnas, fila)) for fila in datos["filas"]), len(datos["filas"])
+    return datos, len(datos) if isinstance(datos, list) else 1
+
+
+def _leer_cuerpo(response: requests.Response) -> bytes:
+    return b"".join(response.iter_content(chunk_size=TAMANIO_BLOQUE))
+
+
+def leer_respuesta(response: requests.Response):
+    # Decodifica según el formato que eligió el servidor. Devuelve
+    # (datos, filas, bytes_leidos); con formato por columnas datos es un
+    # generador de filas que se consume una sola vez.
+    tipo = tipo_respuesta(response)
+    if tipo == TIPO_MSGPACK:
+        import msgpack
+        cuerpo = _leer_cuerpo(response)
+        datos, filas = _desde_columnas(msgpack.unpackb(cuerpo, raw=False))
+        return datos, filas, len(cuerpo)
+    if tipo == TIPO_COLUMNAS:
+        cuerpo = _leer_cuerpo(response)
+        datos, filas = _desde_columnas(json.loads(cuerpo))
+        return datos, filas, len(cuerpo)
+    datos, tamanio = leer_json(response)
+    return datos, len(datos) if isinstance(datos, list) else 1, tamanio
+
+
+def leer_json(response: requests.Response):
+    # Equivalente a response.json(), pero los arreglos se decodifican en
+    # streaming. Devuelve (datos, bytes_leidos).
+    lector = _LectorJSON(response)
+    if lector.primer_caracter() == "[":
+        datos = list(lector.elementos())
+    else:
+        datos = lector.resto()
+    return datos, lector.bytes_leidos
+
+
+def _origen():
+    # El driver de MySQL solo se importa si se usa
+    if ORIGEN == "mysql":
+        import origen_mysql
+        return origen_mysql
+    return None
+
+
+def iterar_filas(endpoint: str, params=None):
+    origen = _origen()
+    if origen is not None:
+        return origen.iterar_filas(endpoint, params)
+    return _iterar_filas_http(endpoint, params)
+
+
+def _iterar_filas_http(endpoint: str, params=None):
+    # Recorre un arreglo JSON de la API sin guardarlo completo en memoria
+    with get(endpoint, params, stream=True) as response:
+        if response.status_code != 200:
+            raise ErrorAPI(response.status_code, _detalle(response))
+        if tipo_respuesta(response) in (TIPO_MSGPACK, TIPO_COLUMNAS):
+            # Formatos compactos: el cuerpo se lee entero, las filas salen una a una
+            datos, _, _ = leer_respuesta(response)
+            yield from datos
+        else:
+            yield from iterar_json(response)
+
+
+def get_json(endpoint: str, params=None, decodificar=None):
+    # Devuelve (datos, tamanio) del origen configurado
+    datos, tamanio, _ = pedir(endpoint, params, decodificar)
+    return datos, tamanio
+
+
+def pedir(endpoint: str, params=None, decodificar=None, validadores=None):
+    # Como get_json, pero condicional si se pasan los validadores de una
+    # respuesta anterior. Devuelve (datos, tamanio, validadores); datos es
+    # NO_MODIFICADO si el servidor contestó 304.
+    origen = _origen()
+    if origen is not None:
+        datos, tamanio = origen.get_json(endpoint, params, decodificar)
+        return datos, tamanio, None
+    return _pedir_http(endpoint, params, decodificar, validadores)
+
+
+def _pedir_http(endpoint: str, params=None, decodificar=None, validadores=None):
+    # Petición + decodificación en el mismo hilo. Se mide por separado la
+    # espera del servidor (hasta los encabezados), la lectura del JSON y la
+    # conversión a registros (ver metricas.py).
+    with metricas.medir("http", endpoint=endpoint) as m:
+        response = get(endpoint, params, stream=True, encabezados=encabezados_condicionales(validadores))
+        m.datos["status"] = response.status_code
+    with response:
+        if response.status_code == 304 and validadores:
+            return NO_MODIFICADO, 0, validadores_de(response) or validadores
+        if response.status_code != 200:
+            raise ErrorAPI(response.status_code, _detalle(response))
+        with metricas.medir("json", endpoint=endpoint, formato=tipo_respuesta(response)) as m:
+            datos, filas, tamanio = leer_respuesta(response)
+            m.datos["bytes"] = tamanio
+            m.datos["bytes_red"] = bytes_red(response)
+            m.datos["filas"] = filas
+    if decodificar is not None:
+        with metricas.medir("decodificar", endpoint=endpoint, filas=filas):
+            datos = decodificar(datos)
+    elif not isinstance(datos, (list, dict)):
+        datos = list(datos)
+    return datos, tamanio, validadores_de(response)
+
+
+# Pedidos en vuelo compartidos por todas las sesiones del proceso (modo web):
+# si llega uno idéntico mientras otro espera respuesta, se une a ese en vez de
+# ir otra vez al backend. El resultado es el mismo objeto para todos y se
+# trata como de solo lectura.
+_en_vuelo = {}  # clave -> Future con (datos, tamanio, validadores)
+_lock_vuelo = threading.Lock()
+
+
+def _clave_vuelo(endpoint: str, params, decodificar) -> tuple:
+    return endpoint, tuple(sorted((params or {}).items())), decodificar
+
+
+def _reservar(clave, forzar: bool):
+    # Devuelve (futuro, propio). propio=True: a este llamador le toca pedirlo.
+    # forzar no se une a un pedido que pudo salir antes del cambio.
+    with _lock_vuelo:
+        futuro = None if forzar else _en_vuelo.get(clave)
+        if futuro is not None:
+            return futuro, False
+        futuro = _en_vuelo[clave] = Future()
+        # En curso: que cancelar a un llamador que espera no lo cancele para los demás
+        futuro.set_running_or_notify_cancel()
+        return futuro, True
+
+
+def _resolver(clave, futuro: Future, endpoint: str, params, decodificar, previo=None):
+    # previo: (datos, tamanio, validadores) guardados, para pedir condicional.
+    # tamanio es lo que ocupan los datos ya decodificados (lo que guarda la
+    # caché), no los bytes del cuerpo, que suelen ser varias veces menos.
+    try:
+        datos, tamanio, validadores = pedir(endpoint, params, decodificar, previo[2] if previo else None)
+        if datos is NO_MODIFICADO:
+            datos, tamanio = previo[0], previo[1]
+        else:
+            tamanio = sesiones.tamanio_estimado(datos)
+        resultado = datos, tamanio, validadores
+    except BaseException as e:
+        futuro.set_exception(e)
+        raise
+    finally:
+        with _lock_vuelo:
+            if _en_vuelo.get(clave) is futuro:
+                del _en_vuelo[clave]
+    futuro.set_result(resultado)
+    return resultado
+
+
+def get_json_compartido(endpoint: str, params=None, decodificar=None, forzar: bool = False, cache=None):
+    # get_json con agrupación de pedidos idénticos (bloqueante, para hilos).
+    # Con cache se comporta como consultar(): lo vigente no toca la red y lo
+    # caducado o forzado con validadores se pide condicional.
+    previo = None
+    if cache is not None:
+        if not forzar:
+            guardado = cache.obtener(endpoint, params)
+            if guardado is not None:
+                return guardado, 0
+        previo = cache.para_revalidar(endpoint, params)
+    clave = _clave_vuelo(endpoint, params, decodificar)
+    futuro, propio = _reservar(clave, forzar)
+    if propio:
+        data, tamanio, validadores = _resolver(clave, futuro, endpoint, params, decodificar, previo)
+    else:
+        data, tamanio, validadores = futuro.result()
+    if cache is not None:
+        cache.guardar(endpoint, params, data, tamanio, validadores)
+    return data, tamanio
+
+
+class ErrorAPI(Exception):
+    def __init__(self, status_code: int, detalle=""):
+        super().__init__(f"{status_code} {detalle}".strip())
+        self.status_code = status_code
+        self.detalle = detalle
+
+
+def _detalle(response) -> str:
+    try:
+        return response.json().get("detail", "")
+    except Exception:
+        return getattr(response, "text", "")
+
+
+async def consultar(endpoint: str, params=None, cache=None, forzar: bool = False, decodificar=None):
+    # Devuelve el JSON ya decodificado (y convertido con decodificar, si se
+    # indica). Si hay caché y la respuesta sigue vigente no se toca la red;
+    # forzar=True ignora lo guardado. Consultas idénticas simultáneas se
+    # resuelven con un solo pedido (ver _en_vuelo). Lo caducado (o forzado)
+    # que tenga validadores se revalida: con un 304 se devuelve el mismo
+    # objeto que ya estaba guardado.
+    previo = None
+    if cache is not None:
+        if not forzar:
+            guardado = cache.obtener(endpoint, params)
+            if guardado is not None:
+                return guardado
+        previo = cache.para_revalidar(endpoint, params)
+    clave = _clave_vuelo(endpoint, params, decodificar)
+    futuro, propio = _reservar(clave, forzar)
+    if propio:
+        data, tamanio, validadores = await asyncio.to_thread(_resolver, clave, futuro, endpoint, params,
+                                                             decodificar, previo)
+    else:
+        # Se espera sin ocupar un hilo
+        data, tamanio, validadores = await asyncio.wrap_future(futuro)
+    if cache is not None:
+        cache.guardar(endpoint, params, data, tamanio, validadores)
+    return data
+
+
+def cerrar():
+    global _sesion
+    with _lock:
+        if _sesion is not None:
+            _sesion.close()
+            _sesion = None
+    if ORIGEN == "mysql":
+        import origen_mysql
+        origen_mysql.cerrar()
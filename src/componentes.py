@@ -0,0 +1,273 @@
+import os
+
+import flet as ft
+
+import metricas
+
+# LISTA_VIRTUAL=0 vuelve a la vista por páginas con botones "Siguientes 100"
+LISTA_VIRTUAL = os.getenv("LISTA_VIRTUAL", "1") == "1"
+
+ALTO_LISTA = 200
+TAMANIO_LOTE = 20        # tarjetas que se construyen por cada scroll
+UMBRAL_SCROLL = 400      # pixeles antes del final para pedir el siguiente lote
+RESERVA_TARJETAS = 200   # tarjetas que la lista virtual conserva para reutilizar
+
+# Medidas de las tarjetas. La lista virtual usa un alto fijo por fila
+# (item_extent), así que cada texto va en una sola línea (lo largo se corta
+# con "...") y el alto sale de estas medidas: un texto de 14 px ocupa unos
+# 20 px y el título de 18 px unos 26 px.
+ALTO_TEXTO = 20
+ALTO_TITULO = 26
+ESPACIO_TEXTOS = 10
+RELLENO_TARJETA = 15
+MARGEN_TARJETA = 4
+
+
+def alto_tarjeta(textos: int) -> int:
+    # Título + (textos - 1) líneas, con su espacio, relleno y margen
+    return (ALTO_TITULO + (textos - 1) * (ALTO_TEXTO + ESPACIO_TEXTOS)
+            + 2 * RELLENO_TARJETA + 2 * MARGEN_TARJETA)
+
+
+EXTENSION_RECIBO = alto_tarjeta(6)   # 214
+EXTENSION_CEDULA = alto_tarjeta(9)   # 304
+
+
+def formatear_fecha(d) -> str:
+    return d.strftime("%d-%m-%Y") if d else ""
+
+
+def _contenedor_tarjeta(textos) -> ft.Card:
+    for t in textos:
+        t.max_lines = 1
+        t.overflow = ft.TextOverflow.ELLIPSIS
+    return ft.Card(
+        content=ft.Container(
+            content=ft.Column(textos, spacing=ESPACIO_TEXTOS),
+            padding=RELLENO_TARJETA,
+            bgcolor=ft.Colors.WHITE,
+            border_radius=10,
+            shadow=ft.BoxShadow(blur_radius=8, color=ft.Colors.GREY_400, offset=ft.Offset(2, 2))
+        ),
+        elevation=2,
+        margin=MARGEN_TARJETA
+    )
+
+
+def boton_descargar(on_formato, formatos) -> ft.PopupMenuButton:
+    # formatos: {"pdf": "PDF", ...}; on_formato recibe la clave elegida
+    return ft.PopupMenuButton(
+        content=ft.Container(
+            content=ft.Row([ft.Icon(ft.Icons.DOWNLOAD, color=ft.Colors.RED),
+                            ft.Text("Descargar", color=ft.Colors.RED)], tight=True),
+            width=150, height=40, bgcolor=ft.Colors.WHITE, border_radius=20,
+            alignment=ft.alignment.center
+        ),
+        items=[ft.PopupMenuItem(text=nombre, on_click=lambda e, f=formato: on_formato(f))
+               for formato, nombre in formatos.items()],
+        tooltip="Descargar lo consultado"
+    )
+
+
+def esqueleto(n: int = 3, alto: int = 60) -> ft.Column:
+    # Marcadores grises mientras llega la primera respuesta
+    return ft.Column(
+        [ft.Container(height=alto, bgcolor=ft.Colors.GREY_200, border_radius=10) for _ in range(n)],
+        spacing=10, height=ALTO_LISTA
+    )
+
+
+class TarjetaRecibo:
+    """Tarjeta de recibo reutilizable: llenar() solo cambia textos y colores."""
+
+    def __init__(self):
+        self.recibo = ft.Text(weight=ft.FontWeight.BOLD, size=18)
+        self.contribuyente = ft.Text()
+        self.concepto = ft.Text()
+        self.fecha = ft.Text()
+        self.neto = ft.Text(weight=ft.FontWeight.BOLD)
+        self.descuento = ft.Text()
+        self._textos = [self.recibo, self.contribuyente, self.concepto, self.fecha, self.descuento]
+        self.control = _contenedor_tarjeta(
+            [self.recibo, self.contribuyente, self.concepto, self.fecha, self.neto, self.descuento]
+        )
+
+    def llenar(self, r):
+        # r es un modelos.Recibo
+        es_cancelado = r.cancelado
+        estado = "❌ CANCELADO" if es_cancelado else ""
+        self.recibo.value = f"Recibo: {r.recibo} {estado}"
+        self.contribuyente.value = f"Contribuyente: {r.contribuyente}"
+        self.concepto.value = f"Concepto: {r.concepto}"
+        self.fecha.value = f"Fecha: {formatear_fecha(r.fecha)}"
+        self.neto.value = f"Neto: ${r.neto:,.2f}"
+        self.descuento.value = f"Descuento: ${r.descuento:,.2f}"
+
+        # El estado cancelado solo cambia colores, no la estructura
+        color_texto = ft.Colors.GREY if es_cancelado else ft.Colors.BLACK
+        for t in self._textos:
+            t.color = color_texto
+        self.neto.color = ft.Colors.GREY if es_cancelado else ft.Colors.GREEN_800
+        return self
+
+
+class TarjetaCedula:
+    """Tarjeta de cédula reutilizable, igual que TarjetaRecibo."""
+
+    def __init__(self):
+        self.folio = ft.Text(weight=ft.FontWeight.BOLD, size=18)
+        self.motivo = ft.Text()
+        self.folio_elec = ft.Text()
+        self.contribuyente = ft.Text()
+        self.direccion = ft.Text(selectable=True)
+        self.fecha = ft.Text()
+        self.importe = ft.Text()
+        self.recibo = ft.Text()
+        self.fecha_recibo = ft.Text()
+        self.control = _contenedor_tarjeta([
+            self.folio, self.motivo, self.folio_elec, self.contribuyente, self.direccion,
+            self.fecha, self.importe, self.recibo, self.fecha_recibo
+        ])
+
+    def llenar(self, r):
+        # r es un modelos.Cedula
+        self.folio.value = f"Cédula: {r.folio}"
+        self.motivo.value = f"Motivo: {r.motivo}"
+        self.folio_elec.value = f"Folio electronico: {r.folio_electronico or 'Sin folio'}"
+        self.contribuyente.value = f"Contribuyente: {r.contribuyente}"
+        self.direccion.value = f"Dirección: {r.direccion}"
+        self.fecha.value = f"Fecha: {formatear_fecha(r.fecham)}"
+        self.importe.value = f"Importe: ${r.importe:,.2f}"
+        self.recibo.value = f"Recibo: {r.recibo_teso if r.pagada else 'Sin recibo'}"
+        self.fecha_recibo.value = f"Fecha recibo: {formatear_fecha(r.fecha_rteso) if r.pagada else 'Sin recibo'}"
+        return self
+
+
+class PoolTarjetas:
+    """Columna paginada que reutiliza sus tarjetas entre páginas.
+
+    Al cambiar de página solo se actualizan los textos de las tarjetas ya
+    creadas (y se ocultan las que sobran), así page.update() envía
+    propiedades cambiadas en lugar de quitar y agregar controles."""
+
+    def __init__(self, crear, on_anterior, on_siguiente, tamanio: int = 100, alto: int = ALTO_LISTA):
+        self.crear = crear
+        self.tamanio = tamanio
+        self.tarjetas = []
+        self.btn_anterior = ft.ElevatedButton(f"⬅️ Anteriores {tamanio}", on_click=lambda e: on_anterior())
+        self.btn_siguiente = ft.ElevatedButton(f"Siguientes {tamanio} ➡️", on_click=lambda e: on_siguiente())
+        self.nav = ft.Row([self.btn_anterior, self.btn_siguiente], alignment=ft.MainAxisAlignment.CENTER)
+        self.columna = ft.Column([self.nav], spacing=10, scroll=ft.ScrollMode.ALWAYS, height=alto)
+
+    def mostrar(self, filas, hay_anterior: bool, hay_siguiente: bool):
+        with metricas.medir("tarjetas", filas=len(filas)):
+            while len(self.tarjetas) < len(filas):
+                tarjeta = self.crear()
+                self.columna.controls.insert(len(self.tarjetas), tarjeta.control)
+                self.tarjetas.append(tarjeta)
+            for tarjeta, r in zip(self.tarjetas, filas):
+                tarjeta.llenar(r)
+                tarjeta.control.visible = True
+        for tarjeta in self.tarjetas[len(filas):]:
+            tarjeta.control.visible = False
+        self.btn_anterior.visible = hay_anterior
+        self.btn_siguiente.visible = hay_siguiente
+
+
+class ListaVirtual:
+    """ListView con scroll continuo que solo construye las tarjetas que se
+    van necesitando, en lotes, en lugar de armar todas las filas de golpe.
+
+    Como PoolTarjetas, las tarjetas se reutilizan: una búsqueda nueva vuelve
+    a llenar las que ya existen (solo viajan los textos que cambiaron) y
+    solo se crean las que faltan."""
+
+    def __init__(self, crear, extension: int, alto: int = ALTO_LISTA, lote: int = TAMANIO_LOTE,
+                 reserva: int = RESERVA_TARJETAS):
+        self.crear = crear
+        self.lote = lote
+        self.reserva = reserva
+        self.vista = ft.ListView(
+            height=alto, item_extent=extension, spacing=10,
+            on_scroll=self._on_scroll, on_scroll_interval=100
+        )
+        self._tarjetas = []     # tarjetas creadas; las primeras son las que están en vista.controls
+        self._filas = []
+        self._mostradas = 0     # filas de _filas que ya tienen tarjeta
+        self._mas = None        # corrutina opcional que trae más filas (modo paginado)
+        self._trayendo = False
+
+    def cargar(self, filas, mas=None):
+        self._filas = filas
+        self._mostradas = 0
+        self._mas = mas
+        # Las mismas tarjetas vuelven a entrar: Flet solo manda lo que cambió
+        self.vista.controls.clear()
+        del self._tarjetas[self.reserva:]
+        self._agregar_lote()
+
+    def ampliar(self, filas):
+        # Misma consulta con más filas (llegan por tramos): no reinicia el scroll
+        self._filas = filas
+        if self._mostradas < self.lote:
+            self._agregar_lote()
+
+    def anteponer(self, nuevas, filas):
+        # filas = nuevas + las que ya estaban: solo se llenan las tarjetas
+        # nuevas y se insertan arriba, sin reiniciar la lista
+        self._filas = filas
+        with metricas.medir("tarjetas", filas=len(nuevas)):
+            tarjetas = [self.crear().llenar(r) for r in nuevas]
+        self._tarjetas[0:0] = tarjetas
+        self.vista.controls[0:0] = [t.control for t in tarjetas]
+        self._mostradas += len(nuevas)
+
+    def reemplazar(self, anterior, actual):
+        # Vuelve a llenar la tarjeta de un registro ya mostrado (si la tiene).
+        # Las filas no se tocan: pueden ser las de la caché; quien llama pasa
+        # después la lista nueva con anteponer() o ampliar().
+        base = len(self.vista.controls) - self._mostradas
+        for i in range(self._mostradas):
+            if self._filas[i] is anterior:
+                self._tarjetas[base + i].llenar(actual)
+                return
+
+    def _agregar_lote(self) -> bool:
+        fin = min(self._mostradas + self.lote, len(self._filas))
+        if fin == self._mostradas:
+            return False
+        inicio = len(self.vista.controls)
+        with metricas.medir("tarjetas", filas=fin - self._mostradas):
+            for k, r in enumerate(self._filas[self._mostradas:fin], inicio):
+                if k == len(self._tarjetas):
+                    self._tarjetas.append(self.crear())
+                self._tarjetas[k].llenar(r)
+            self.vista.controls.extend(t.control for t in self._tarjetas[inicio:inicio + fin - self._mostradas])
+        self._mostradas = fin
+        return True
+
+    def _on_scroll(self, e: ft.OnScrollEvent):
+        if e.pixels < e.max_scroll_extent - UMBRAL_SCROLL:
+            return
+        if self._agregar_lote():
+            self.vista.update()
+        elif self._mas is not None and not self._trayendo:
+            self._trayendo = True
+            self.vista.page.run_task(self._traer_mas)
+
+    async def _traer_mas(self):
+        try:
+            nuevas = await self._mas()
+        except Exception as e:
+            print("Error al traer más filas:", str(e))
+            nuevas = []
+        finally:
+            self._trayendo = False
+        if not nuevas:
+            self._mas = None
+            return
+        # Las filas ya mostradas no se vuelven a guardar
+        self._filas = nuevas
+        self._mostradas = 0
+        self._agregar_lote()
+        self.vista.update()
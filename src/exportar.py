@@ -0,0 +1,181 @@
+import csv
+import os
+import time
+import uuid
+
+import totales
+
+# Exportación local de recibos y cédulas a CSV, XLSX o PDF. Los registros
+# llegan como un iterable (la lista ya cargada o un generador que va
+# trayendo páginas de la API) y se escriben fila por fila, así la memoria
+# no depende del tamaño del rango. Los totales se acumulan mientras se
+# escribe y van al final del archivo.
+#
+# XLSX usa openpyxl (modo write_only) y PDF usa fpdf2; se importan solo al
+# exportar en ese formato.
+
+FORMATOS = {"pdf": "PDF", "csv": "CSV", "xlsx": "Excel (XLSX)"}
+
+# Carpeta servida como /assets en modo web; ahí se dejan los archivos
+# generados para descargarlos con launch_url.
+CARPETA_WEB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "exportes")
+VIGENCIA_WEB = 60 * 60  # segundos que se conservan los archivos generados
+
+
+def _fecha(d) -> str:
+    return d.strftime("%d-%m-%Y") if d else ""
+
+
+COLUMNAS = {
+    "recibos": [
+        ("Recibo", lambda r: r.recibo),
+        ("Fecha", lambda r: _fecha(r.fecha)),
+        ("Contribuyente", lambda r: r.contribuyente),
+        ("Concepto", lambda r: r.concepto),
+        ("Cuenta", lambda r: r.cuenta or ""),
+        ("Neto", lambda r: r.neto),
+        ("Descuento", lambda r: r.descuento),
+        ("Estado", lambda r: "CANCELADO" if r.cancelado else ""),
+    ],
+    "cedulas": [
+        ("Cédula", lambda c: c.folio),
+        ("Fecha", lambda c: _fecha(c.fecham)),
+        ("Contribuyente", lambda c: c.contribuyente),
+        ("Dirección", lambda c: c.direccion),
+        ("Motivo", lambda c: c.motivo),
+        ("Folio electrónico", lambda c: c.folio_electronico or ""),
+        ("Importe", lambda c: c.importe),
+        ("Recibo", lambda c: c.recibo_teso or "Sin recibo"),
+        ("Fecha recibo", lambda c: _fecha(c.fecha_rteso) if c.pagada else ""),
+    ],
+}
+
+# Ancho relativo de cada columna en el PDF
+ANCHOS_PDF = {
+    "recibos": [16, 18, 60, 60, 20, 22, 22, 24],
+    "cedulas": [16, 18, 48, 52, 40, 28, 22, 20, 20],
+}
+
+
+def _acumulador(tipo: str):
+    return totales.TotalesRecibos() if tipo == "recibos" else totales.TotalesCedulas()
+
+
+def _bloque_totales(tipo: str, t) -> list:
+    if tipo == "recibos":
+        return [
+            ("Recibos", t.cantidad),
+            ("Recibos cancelados", t.cancelados),
+            ("Total Neto", t.total_neto),
+            ("Total Descuento", t.total_descuento),
+        ]
+    return [
+        ("Cédulas", t.cantidad),
+        ("Importe total", t.importe),
+        ("Pagadas", f"{t.pagadas} (${t.importe_pagadas:,.2f})"),
+        ("Sin pagar", f"{t.pendientes} (${t.importe_pendientes:,.2f})"),
+    ]
+
+
+def _filas(tipo: str, registros, acumulado):
+    columnas = COLUMNAS[tipo]
+    for r in registros:
+        acumulado.agregar(r)
+        yield [f(r) for _, f in columnas]
+
+
+def _csv(ruta, tipo, titulo, registros, acumulado):
+    # utf-8-sig para que Excel respete acentos al abrir el CSV
+    with open(ruta, "w", newline="", encoding="utf-8-sig") as f:
+        w = csv.writer(f)
+        w.writerow([titulo])
+        w.writerow([nombre for nombre, _ in COLUMNAS[tipo]])
+        w.writerows(_filas(tipo, registros, acumulado))
+        w.writerow([])
+        w.writerows(_bloque_totales(tipo, acumulado))
+
+
+def _xlsx(ruta, tipo, titulo, registros, acumulado):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(tipo.capitalize())
+    ws.append([titulo])
+    ws.append([nombre for nombre, _ in COLUMNAS[tipo]])
+    for fila in _filas(tipo, registros, acumulado):
+        ws.append(fila)
+    ws.append([])
+    for fila in _bloque_totales(tipo, acumulado):
+        ws.append(list(fila))
+    wb.save(ruta)
+
+
+def _pdf(ruta, tipo, titulo, registros, acumulado):
+    from fpdf import FPDF
+
+    columnas = COLUMNAS[tipo]
+    pdf = FPDF(orientation="L", format="Letter")
+    pdf.set_auto_page_break(auto=True, margin=12)
+    ancho_util = pdf.w - pdf.l_margin - pdf.r_margin
+    pesos = ANCHOS_PDF[tipo]
+    anchos = [ancho_util * p / sum(pesos) for p in pesos]
+
+    def encabezado():
+        pdf.set_font("Helvetica", "B", 8)
+        for (nombre, _), ancho in zip(columnas, anchos):
+            pdf.cell(ancho, 6, nombre, border=1)
+        pdf.ln()
+        pdf.set_font("Helvetica", size=7)
+
+    def texto(valor, ancho) -> str:
+        valor = f"${valor:,.2f}" if not isinstance(valor, (str, int)) else str(valor)
+        # Helvetica solo trae latin-1; se recorta al ancho de la celda
+        valor = valor.encode("latin-1", "replace").decode("latin-1")
+        while valor and pdf.get_string_width(valor) > ancho - 1:
+            valor = valor[:-1]
+        return valor
+
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 12)
+    pdf.cell(0, 8, texto(titulo, ancho_util), new_x="LMARGIN", new_y="NEXT")
+    encabezado()
+    for fila in _filas(tipo, registros, acumulado):
+        if pdf.will_page_break(5):
+            pdf.add_page()
+            encabezado()
+        for valor, ancho in zip(fila, anchos):
+            pdf.cell(ancho, 5, texto(valor, ancho), border=1)
+        pdf.ln()
+
+    pdf.ln(4)
+    pdf.set_font("Helvetica", "B", 9)
+    for nombre, valor in _bloque_totales(tipo, acumulado):
+        pdf.cell(60, 6, texto(nombre, 60))
+        pdf.cell(60, 6, texto(valor, 60), new_x="LMARGIN", new_y="NEXT")
+    pdf.output(ruta)
+
+
+_ESCRITORES = {"csv": _csv, "xlsx": _xlsx, "pdf": _pdf}
+
+
+def exportar(ruta: str, formato: str, tipo: str, titulo: str, registros):
+    # Escribe el archivo y devuelve los totales acumulados. Bloqueante: se
+    # debe llamar desde un hilo (asyncio.to_thread).
+    acumulado = _acumulador(tipo)
+    _ESCRITORES[formato](ruta, tipo, titulo, registros, acumulado)
+    return acumulado
+
+
+def ruta_web(nombre_archivo: str):
+    # Devuelve (ruta en disco, url relativa) para servir el archivo en modo
+    # web, y de paso borra lo generado hace más de VIGENCIA_WEB segundos.
+    os.makedirs(CARPETA_WEB, exist_ok=True)
+    limite = time.time() - VIGENCIA_WEB
+    for carpeta in os.scandir(CARPETA_WEB):
+        if carpeta.is_dir() and carpeta.stat().st_mtime < limite:
+            for archivo in os.scandir(carpeta.path):
+                os.remove(archivo.path)
+            os.rmdir(carpeta.path)
+    token = uuid.uuid4().hex
+    os.makedirs(os.path.join(CARPETA_WEB, token))
+    return os.path.join(CARPETA_WEB, token, nombre_archivo), f"/exportes/{token}/{nombre_archivo}"
@@ -0,0 +1,148 @@
+import threading
+import unicodedata
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+# Índice en memoria para buscar contribuyentes (y dirección/motivo en
+# cédulas) sobre resultados ya descargados, sin volver a la API.
+# - Normaliza mayúsculas y acentos: "Núñez" == "NUNEZ".
+# - buscar(): subcadena exacta, igual que el filtro de la API (lo que se
+#   filtra o exporta sin red debe ser lo mismo que devolvería el servidor).
+#   Cada palabra de la consulta acota candidatos (trigramas para 3+ letras)
+#   y después se verifica la consulta completa contra cada campo.
+# - sugerir(): parecidos por similitud de trigramas (tolera errores de
+#   dedo); solo para proponer nombres, nunca como resultado.
+
+SIMILITUD_MINIMA = 0.6
+
+
+def normalizar(texto) -> str:
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFD", str(texto))
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return " ".join(sin_acentos.casefold().split())
+
+
+def _trigramas(texto: str):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+class IndiceTexto:
+    """Índice de palabras, prefijos y trigramas sobre atributos de texto.
+
+    Los nombres se repiten mucho entre filas, así que los trigramas se
+    calculan sobre las palabras distintas y cada palabra apunta a sus filas."""
+
+    def __init__(self, registros, campos):
+        self.registros = registros
+        self.campos = campos
+        self._palabras = None
+        self._lock = threading.Lock()
+
+    def preparar(self):
+        # Construye el índice; se puede llamar desde un hilo apenas llegan
+        # los resultados para que la primera búsqueda ya lo encuentre listo.
+        with self._lock:
+            if self._palabras is None:
+                self._construir()
+
+    def _construir(self):
+        filas_por_palabra = {}
+        for i, r in enumerate(self.registros):
+            texto = normalizar(" ".join(getattr(r, c) or "" for c in self.campos))
+            for palabra in set(texto.split()):
+                filas = filas_por_palabra.get(palabra)
+                if filas is None:
+                    filas_por_palabra[palabra] = filas = array("I")
+                filas.append(i)
+
+        palabras = sorted(filas_por_palabra)
+        trigramas = {}
+        for j, palabra in enumerate(palabras):
+            for t in _trigramas(" " + palabra + " "):
+                lista = trigramas.get(t)
+                if lista is None:
+                    trigramas[t] = lista = array("I")
+                lista.append(j)
+        self._filas_por_palabra = filas_por_palabra
+        self._trigramas = trigramas
+        self._palabras = palabras
+
+    def _filas(self, indices_palabras) -> set:
+        ids = set()
+        for j in indices_palabras:
+            ids.update(self._filas_por_palabra[self._palabras[j]])
+        return ids
+
+    def _por_prefijo(self, prefijo: str):
+        inicio = bisect_left(self._palabras, prefijo)
+        fin = bisect_left(self._palabras, prefijo + "\uffff", inicio)
+        return range(inicio, fin)
+
+    def _por_subcadena(self, palabra: str) -> list:
+        listas = [self._trigramas.get(t) for t in _trigramas(palabra)]
+        if any(lista is None for lista in listas):
+            return []
+        palabras = self._palabras
+        return [j for j in min(listas, key=len) if palabra in palabras[j]]
+
+    def _por_similitud(self, palabra: str) -> list:
+        trigramas = _trigramas(" " + palabra + " ")
+        conteo = Counter()
+        for t in trigramas:
+            conteo.update(self._trigramas.get(t, ()))
+        minimo = max(1, int(len(trigramas) * SIMILITUD_MINIMA + 0.5))
+        return [j for j, n in conteo.items() if n >= minimo]
+
+    def _candidatos(self, palabras, parecidos: bool) -> set:
+        ids = None
+        for palabra in sorted(palabras, key=len, reverse=True):
+            if len(palabra) < 3:
+                if parecidos:
+                    coincidencias = self._por_prefijo(palabra)
+                else:
+                    coincidencias = [j for j, p in enumerate(self._palabras) if palabra in p]
+            else:
+                coincidencias = self._por_subcadena(palabra)
+                if parecidos and not coincidencias:
+                    coincidencias = self._por_similitud(palabra)
+            encontrados = self._filas(coincidencias)
+            ids = encontrados if ids is None else ids & encontrados
+            if not ids:
+                return set()
+        return ids
+
+    def buscar(self, consulta: str) -> list:
+        # Registros con la consulta como subcadena de alguno de los campos,
+        # en el orden original
+        palabras = normalizar(consulta).split()
+        if not palabras:
+            return self.registros
+        if self._palabras is None:
+            self.preparar()
+        texto = " ".join(palabras)
+        resultado = []
+        for i in sorted(self._candidatos(palabras, parecidos=False)):
+            r = self.registros[i]
+            if any(texto in normalizar(getattr(r, c)) for c in self.campos):
+                resultado.append(r)
+        return resultado
+
+    def sugerir(self, consulta: str, maximo: int = 3) -> list:
+        # Valores del primer campo (p. ej. contribuyentes) parecidos a la
+        # consulta, para un "¿quisiste decir...?"
+        palabras = normalizar(consulta).split()
+        if not palabras:
+            return []
+        if self._palabras is None:
+            self.preparar()
+        sugerencias = []
+        for i in sorted(self._candidatos(palabras, parecidos=True)):
+            valor = getattr(self.registros[i], self.campos[0])
+            if valor and valor not in sugerencias:
+                sugerencias.append(valor)
+                if len(sugerencias) == maximo:
+                    break
+        return sugerencias
@@ -1,23 +1,56 @@
+import asyncio
+import json
+import os
+import threading
 import flet as ft
 from datetime import datetime, date
-import requests
 import pytz
-from urllib.parse import quote_plus
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
 
-API_URL = os.getenv("API_URL")
-
-def main(page: ft.Page):
+import almacen_local
+import cache_consultas
+import cliente_api
+import exportar
+import indice
+import metricas
+import componentes
+import modelos
+import paginacion
+import seguimiento
+import sesiones
+import tramos
+import totales
+from cliente_api import ErrorAPI
+
+# Segundos sin teclear antes de lanzar la búsqueda por contribuyente
+ESPERA_BUSQUEDA = float(os.getenv("ESPERA_BUSQUEDA", "0.4"))
+
+# Logo del municipio. Si está copiado en src/assets/logo.jpg se sirve
+# localmente, sin depender de la red; si no, se usa la imagen original en
+# línea. (assets/icon.png es el ícono genérico de la plantilla de Flet.)
+LOGO_URL = "https://i.ibb.co/TqxbQnsq/Imagen-de-Whats-App-2025-04-23-a-las-10-14-29-559a5c08.jpg"
+LOGO = "logo.jpg" if os.path.exists(os.path.join(os.path.dirname(__file__), "assets", "logo.jpg")) else LOGO_URL
+
+async def main(page: ft.Page):
     page.theme_mode = ft.ThemeMode.LIGHT
     page.theme = ft.Theme(color_scheme_seed=ft.Colors.ORANGE)
     page.title = "Recibos"
     page.padding = 10
+    # Con METRICAS=1 se mide cada envío al cliente (ver metricas.py)
+    page.update = metricas.envolver("page.update", page.update)
 
     # --- Estado / variables de la pantalla principal (RECIBOS) ---
     todos_los_recibos = []
+    consulta_recibos = None  # solo en modo paginado (API_PAGINADO=1)
+    totales_recibos = None   # calculados en el cliente cuando se tiene todo el rango
+    totales_servidor = None  # (params, respuesta de recibos/totales), para compararlos
+    params_recibos = None    # params de la consulta que está en pantalla
+    base_recibos = None      # respuesta completa de params_recibos (para refinar sin red)
+    indice_recibos = None    # índice de contribuyentes sobre base_recibos
+    filtro_recibos = ""      # texto con el que se refinó base_recibos en el cliente
+    busqueda_en_curso = None
+    seguimiento_hoy = None     # recibos de hoy en pantalla que se siguen actualizando
+    tarea_seguimiento = None
+    recibos_liberados = True   # sin filas en memoria (aún no cargadas o vista oculta)
     pagina_actual = 0
     tamanio_pagina = 100
 
@@ -25,11 +58,14 @@ def main(page: ft.Page):
     hoy = datetime.now(zona_horaria).date()
     hoy_str = hoy.isoformat()
 
+    # Respuestas ya descargadas, compartidas con las demás sesiones del
+    # proceso (ver cache_consultas.py)
+    cache = cache_consultas.compartida()
+    # Memoria que retiene esta sesión (ver sesiones.py)
+    sesion = sesiones.abrir(page.session_id)
+
     # --- Widgets compartidos / Home (RECIBOS) ---
-    logo = ft.Image(
-        src="https://i.ibb.co/TqxbQnsq/Imagen-de-Whats-App-2025-04-23-a-las-10-14-29-559a5c08.jpg",
-        width=60, height=60, fit=ft.ImageFit.CONTAIN
-    )
+    logo = ft.Image(src=LOGO, width=60, height=60, fit=ft.ImageFit.CONTAIN)
 
     titulo_empresa = ft.Text("DZEMUL", size=26, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)
     titulo = ft.Text("Consulta de Recibos", size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)
@@ -46,6 +82,9 @@ def main(page: ft.Page):
         txt.data = nueva_fecha
         txt.value = datetime.fromisoformat(nueva_fecha).strftime("%d-%m-%Y")
         page.update()
+        if en_curso(busqueda_en_curso):
+            # Cambió el rango a media búsqueda: se descarta la anterior
+            lanzar_busqueda(contribuyente_input.value)
 
     date_picker_desde = ft.DatePicker(on_change=lambda e: actualizar_fecha(txt_fecha_desde, e.data), value=date.today())
     date_picker_hasta = ft.DatePicker(on_change=lambda e: actualizar_fecha(txt_fecha_hasta, e.data), value=date.today())
@@ -79,9 +118,19 @@ def main(page: ft.Page):
         bgcolor=ft.Colors.BLUE, color=ft.Colors.WHITE, icon_color=ft.Colors.WHITE
     )
 
-    descargarpdf_btn = ft.ElevatedButton(
-        "Descargar PDF", width=150, height=40, icon=ft.Icons.DOWNLOAD,
-        bgcolor=ft.Colors.WHITE, color=ft.Colors.RED, icon_color=ft.Colors.RED
+    refrescar_btn = ft.IconButton(
+        icon=ft.Icons.REFRESH, icon_color=ft.Colors.WHITE, tooltip="Actualizar (ignora la caché)"
+    )
+    cancelar_btn = ft.IconButton(
+        icon=ft.Icons.CANCEL, icon_color=ft.Colors.WHITE, tooltip="Cancelar búsqueda", visible=False
+    )
+    metricas_btn = ft.IconButton(
+        icon=ft.Icons.SPEED, icon_color=ft.Colors.WHITE, tooltip="Métricas",
+        visible=metricas.ACTIVO, on_click=lambda e: mostrar_metricas()
+    )
+
+    descargarpdf_btn = componentes.boton_descargar(
+        lambda formato: page.run_task(exportar_recibos, formato), exportar.FORMATOS
     )
 
     # Diálogo de resumen:
@@ -91,6 +140,9 @@ def main(page: ft.Page):
     resultado_card = ft.Container(content=ft.Column([], scroll=ft.ScrollMode.AUTO, height=200), padding=10)
     totales_card = ft.Container()
     loader = ft.ProgressRing(visible=False, color=ft.Colors.ORANGE, stroke_width=4)
+    loader_totales = ft.ProgressRing(visible=False, color=ft.Colors.ORANGE, stroke_width=4)
+    txt_encontrados = ft.Text("", size=14, color=ft.Colors.BLACK)
+    txt_seguimiento = ft.Text("", size=12, color=ft.Colors.GREEN_800, visible=False)
 
     # Encabezado (Home)
     encabezado = ft.Container(
@@ -99,7 +151,8 @@ def main(page: ft.Page):
             titulo,
             ft.Row([fecha_desde_btn, fecha_hasta_btn]),
             ft.Row([txt_fecha_desde, txt_fecha_hasta]),
-            ft.Row([buscar_btn, desplegar_btn], alignment=ft.MainAxisAlignment.START),
+            ft.Row([buscar_btn, desplegar_btn, refrescar_btn, cancelar_btn, metricas_btn],
+                   alignment=ft.MainAxisAlignment.START),
             cedulas_btn,
             contribuyente_input
         ]),
@@ -121,188 +174,578 @@ def main(page: ft.Page):
         page.open(snack_bar)
         page.update()
 
-    # --- Lógica de HOME (RECIBOS) ---
-    def formatear_fecha_yymmdd(f):
+    # Panel de depuración (solo con METRICAS=1): promedios y últimas mediciones
+    metricas_dialog = ft.AlertDialog(title=ft.Text("Métricas"))
+
+    def mostrar_metricas():
+        items = [ft.Text("Promedios", size=16, weight=ft.FontWeight.BOLD)]
+        for nombre, veces, promedio, maximo in metricas.resumen():
+            items.append(ft.Text(f"{nombre}: {veces} veces, prom. {promedio:,.0f} ms, máx. {maximo:,.0f} ms", size=14))
+        items.append(ft.Divider())
+        items.append(ft.Text("Últimas", size=16, weight=ft.FontWeight.BOLD))
+        for r in reversed(metricas.ultimas()):
+            extra = ", ".join(f"{k}={v}" for k, v in r.items() if k not in ("t", "medida", "ms"))
+            items.append(ft.Text(f"{r['medida']} {r['ms']:,.0f} ms  {extra}", size=12))
+        metricas_dialog.content = ft.Column(items, height=400, width=500, scroll=ft.ScrollMode.ALWAYS)
+        metricas_dialog.actions = [ft.TextButton("Copiar", on_click=lambda e: copiar_metricas())]
+        page.open(metricas_dialog)
+
+    def copiar_metricas():
+        # Para adjuntar números reales a un reporte de lentitud
+        lineas = (json.dumps(r, ensure_ascii=False, default=str) for r in metricas.ultimas(metricas.RECIENTES_MAX))
+        page.set_clipboard("\n".join(lineas))
+        show_snack("Métricas copiadas al portapapeles.", icon=ft.Icons.CONTENT_COPY)
+
+    def en_curso(tarea) -> bool:
+        return tarea is not None and not tarea.done()
+
+    def se_puede_refinar(params_base, params) -> bool:
+        # True si params solo acota (por contribuyente) una consulta ya cargada
+        if params_base is None:
+            return False
+        if (params_base["desde"], params_base["hasta"]) != (params["desde"], params["hasta"]):
+            return False
+        anterior = indice.normalizar(params_base.get("contribuyente", ""))
+        return anterior in indice.normalizar(params.get("contribuyente", ""))
+
+    def indexar(registros, campos) -> indice.IndiceTexto:
+        ix = indice.IndiceTexto(registros, campos)
+        page.run_task(asyncio.to_thread, ix.preparar)
+        return ix
+
+    def sugerir_parecidos(ix, nombre):
+        # Sin coincidencia exacta: se proponen nombres parecidos, sin filtrar con ellos
+        parecidos = ix.sugerir(nombre)
+        if parecidos:
+            show_snack("¿Quisiste decir: " + ", ".join(parecidos) + "?", icon=ft.Icons.LIGHTBULB)
+
+    def sin_cambios(filas, mostradas, completo=True) -> bool:
+        # True si filas son los mismos registros ya pintados (o su comienzo,
+        # con completo=False). Una respuesta revalidada con 304 devuelve los
+        # mismos objetos de la caché; el almacén local arma objetos nuevos en
+        # cada lectura, así que si no son los mismos se comparan los valores.
+        if mostradas is None or len(filas) > len(mostradas) or (completo and len(filas) != len(mostradas)):
+            return False
+        return all(a is b or modelos.iguales(a, b) for a, b in zip(filas, mostradas))
+
+    def conservar_mostradas(filas, mostradas) -> list:
+        # Sin cambios: se siguen usando los objetos ya pintados, que son los
+        # que la lista, el índice y el seguimiento conocen (por identidad)
+        return mostradas + filas[len(mostradas):] if len(filas) > len(mostradas) else mostradas
+
+    # Exportación (compartida por Recibos y Cédulas)
+    selector_archivo = ft.FilePicker()
+    page.overlay.append(selector_archivo)
+
+    async def elegir_ruta(nombre_archivo, formato):
+        loop = asyncio.get_running_loop()
+        elegido = loop.create_future()
+
+        def on_result(e: ft.FilePickerResultEvent):
+            loop.call_soon_threadsafe(lambda: elegido.done() or elegido.set_result(e.path))
+
+        selector_archivo.on_result = on_result
+        selector_archivo.save_file(file_name=nombre_archivo, allowed_extensions=[formato])
+        return await elegido
+
+    async def guardar_exportacion(nombre_archivo, formato, tipo, titulo, registros):
+        if page.web:
+            # En web no hay diálogo de guardar: se sirve desde /assets
+            ruta, url = exportar.ruta_web(nombre_archivo)
+        else:
+            ruta = await elegir_ruta(nombre_archivo, formato)
+            if not ruta:
+                return
+        show_snack("Generando archivo...", icon=ft.Icons.DOWNLOAD)
         try:
-            return datetime.strptime(f, "%y%m%d").strftime("%d-%m-%Y")
-        except Exception:
-            return f
+            await asyncio.to_thread(exportar.exportar, ruta, formato, tipo, titulo, registros)
+        except paginacion.OffsetIgnorado as e:
+            print("Error al exportar:", str(e))
+            if os.path.exists(ruta):
+                os.remove(ruta)  # incompleto
+            show_snack("No se pudo exportar todo: el servidor no pagina los resultados.",
+                       icon=ft.Icons.ERROR, bg=ft.Colors.RED)
+            return
+        except ImportError as e:
+            print("Falta dependencia para exportar:", str(e))
+            show_snack(f"No se puede exportar a {exportar.FORMATOS[formato]}: falta {e.name}.", bg=ft.Colors.RED)
+            return
+        except Exception as e:
+            print("Error al exportar:", str(e))
+            show_snack("No se pudo generar el archivo.", icon=ft.Icons.ERROR, bg=ft.Colors.RED)
+            return
+        if page.web:
+            page.launch_url(url)
+        else:
+            show_snack(f"Archivo guardado en {ruta}", icon=ft.Icons.CHECK)
 
-    def descargar_pdf_recibos(e):
-        desde = fmt_api(txt_fecha_desde.data)
-        hasta = fmt_api(txt_fecha_hasta.data)
+    # --- Lógica de HOME (RECIBOS) ---
+    async def exportar_recibos(formato):
+        # Si lo pedido ya está cargado se exporta de memoria; si no, se va
+        # leyendo de la API por lotes mientras se escribe el archivo.
         nombre = (contribuyente_input.value or "").strip()
-        if nombre:
-            url = f"{API_URL}recibos/reporte?desde={desde}&hasta={hasta}&contribuyente={quote_plus(nombre)}"
+        params = params_recibos_actuales(nombre)
+        if base_recibos is not None and se_puede_refinar(params_recibos, params):
+            registros = indice_recibos.buscar(nombre)
         else:
-            url = f"{API_URL}recibos/reporte?desde={desde}&hasta={hasta}"
-        page.launch_url(url)
-
-    descargarpdf_btn.on_click = descargar_pdf_recibos
+            endpoint = "recibos/filtrar" if nombre else "recibos"
+            registros = paginacion.iterar_registros(endpoint, params, modelos.decodificar_recibos)
+        titulo = f"Recibos del {txt_fecha_desde.value} al {txt_fecha_hasta.value}"
+        if nombre:
+            titulo += f" - {nombre}"
+        archivo = f"recibos_{params['desde']}_{params['hasta']}.{formato}"
+        await guardar_exportacion(archivo, formato, "recibos", titulo, registros)
 
     def cambiar_pagina(delta):
         nonlocal pagina_actual
         pagina_actual += delta
+        if consulta_recibos is not None:
+            page.run_task(cargar_pagina_recibos)
+        else:
+            mostrar_pagina()
+
+    async def cargar_pagina_recibos():
+        loader.visible = True
+        page.update()
+        try:
+            await consulta_recibos.cargar(pagina_actual)
+        except Exception as e:
+            print("Error al cargar página de recibos:", str(e))
+        loader.visible = False
         mostrar_pagina()
 
-    def mostrar_resultados(data):
-        nonlocal todos_los_recibos, pagina_actual
+    def mostrar_resultados(data, consulta=None, continuar=False):
+        # continuar=True: las mismas filas de antes con más al final (tramos)
+        nonlocal todos_los_recibos, consulta_recibos, pagina_actual
+        if consulta_recibos is not None:
+            consulta_recibos.cancelar()
         todos_los_recibos = data
-        pagina_actual = 0
-        mostrar_pagina()
+        consulta_recibos = consulta
+        if not continuar:
+            pagina_actual = 0
+        if componentes.LISTA_VIRTUAL and continuar:
+            lista_recibos.ampliar(data)
+            resultado_card.content = lista_recibos.vista
+            page.update()
+        elif componentes.LISTA_VIRTUAL:
+            lista_recibos.cargar(data, siguiente_pagina_recibos if consulta is not None else None)
+            resultado_card.content = lista_recibos.vista
+            page.update()
+        else:
+            mostrar_pagina()
+
+    async def siguiente_pagina_recibos():
+        # Scroll continuo en modo paginado: trae la página que sigue
+        nonlocal pagina_actual
+        if consulta_recibos is None or not consulta_recibos.hay_siguiente(pagina_actual):
+            return []
+        pagina_actual += 1
+        await consulta_recibos.cargar(pagina_actual)
+        return consulta_recibos.filas(pagina_actual)
+
+    lista_recibos = componentes.ListaVirtual(
+        componentes.TarjetaRecibo, componentes.EXTENSION_RECIBO
+    )
+    pool_recibos = componentes.PoolTarjetas(
+        componentes.TarjetaRecibo, lambda: cambiar_pagina(-1), lambda: cambiar_pagina(1), tamanio_pagina
+    )
 
     def mostrar_pagina():
         nonlocal pagina_actual, tamanio_pagina, todos_los_recibos
 
-        inicio = pagina_actual * tamanio_pagina
-        fin = inicio + tamanio_pagina
-        fragmento = todos_los_recibos[inicio:fin]
-
-        recibos_widgets = []
-        for r in fragmento:
-            es_cancelado = r.get("status", r.get("id_status", "0")) == "1"
-            color_texto = ft.Colors.GREY if es_cancelado else ft.Colors.BLACK
-            estado = "❌ CANCELADO" if es_cancelado else ""
-
-            tarjeta = ft.Card(
-                content=ft.Container(
-                    content=ft.Column([
-                        ft.Text(f"Recibo: {r['recibo']} {estado}", weight=ft.FontWeight.BOLD, size=18, color=color_texto),
-                        ft.Text(f"Contribuyente: {r['contribuyente']}", color=color_texto),
-                        ft.Text(f"Concepto: {r['concepto']}", color=color_texto),
-                        ft.Text(f"Fecha: {formatear_fecha_yymmdd(r['fecha'])}", color=color_texto),
-                        ft.Text(f"Neto: ${float(r['neto']):,.2f}", weight=ft.FontWeight.BOLD,
-                                color=ft.Colors.GREEN_800 if not es_cancelado else ft.Colors.GREY),
-                        ft.Text(f"Descuento: ${float(r['descuento']):,.2f}", color=color_texto)
-                    ]),
-                    padding=15,
-                    bgcolor=ft.Colors.WHITE,
-                    border_radius=10,
-                    shadow=ft.BoxShadow(blur_radius=8, color=ft.Colors.GREY_400, offset=ft.Offset(2, 2))
-                ),
-                elevation=2
-            )
-            recibos_widgets.append(tarjeta)
+        if consulta_recibos is not None:
+            fragmento = consulta_recibos.filas(pagina_actual)
+            hay_siguiente = consulta_recibos.hay_siguiente(pagina_actual)
+        else:
+            inicio = pagina_actual * tamanio_pagina
+            fin = inicio + tamanio_pagina
+            fragmento = todos_los_recibos[inicio:fin]
+            hay_siguiente = fin < len(todos_los_recibos)
+
+        # Las tarjetas se reutilizan: solo viajan los textos que cambiaron
+        pool_recibos.mostrar(fragmento, pagina_actual > 0, hay_siguiente)
+        resultado_card.content = pool_recibos.columna
+        page.update()
 
-        botones_navegacion = []
-        if pagina_actual > 0:
-            botones_navegacion.append(ft.ElevatedButton("⬅️ Anteriores 100", on_click=lambda e: cambiar_pagina(-1)))
-        if fin < len(todos_los_recibos):
-            botones_navegacion.append(ft.ElevatedButton("Siguientes 100 ➡️", on_click=lambda e: cambiar_pagina(1)))
+    async def consultar_lista(endpoint, params, forzar=False, tamanio=tamanio_pagina, al_avanzar=None):
+        # Devuelve (filas, consulta). Con el almacén local activo se consulta
+        # SQLite (sincronizando antes). En modo paginado solo se trae la primera
+        # página y la consulta sabe pedir las siguientes; si no, el rango se
+        # pide por tramos (tramos.py) y al_avanzar(filas) recibe lo que ya
+        # llegó, en orden de fecha.
+        decodificar = modelos.DECODIFICADORES.get(endpoint)
+        if almacen_local.ACTIVO and not paginacion.PAGINADO:
+            # Días cerrados desde SQLite; solo se descarga lo que falta y hoy
+            avanzar = None
+            if al_avanzar is not None:
+                loop = asyncio.get_running_loop()
+                avanzar = lambda filas: loop.call_soon_threadsafe(al_avanzar, filas)
+            cancelado = threading.Event()
+            try:
+                data, completo = await asyncio.to_thread(
+                    almacen_local.obtener().consultar, endpoint, params, forzar, avanzar, cancelado
+                )
+            except asyncio.CancelledError:
+                # El hilo deja de leer y los tramos que no empezaron se descartan
+                cancelado.set()
+                raise
+            if not completo:
+                show_snack("Sin conexión con el servidor: se muestran los datos guardados.",
+                           icon=ft.Icons.CLOUD_OFF, bg=ft.Colors.AMBER_100)
+            return data, None
+        if paginacion.PAGINADO:
+            consulta = paginacion.ConsultaPaginada(endpoint, params, tamanio, decodificar)
+            await consulta.cargar(0)
+            if consulta.completo:
+                return consulta.todos, None
+            return consulta.filas(0), consulta
+        return await tramos.consultar(endpoint, params, cache, forzar, decodificar, al_avanzar), None
+
+    def texto_encontrados(data, consulta) -> str:
+        if consulta is None:
+            return str(len(data))
+        if consulta.total is not None:
+            return str(consulta.total)
+        return f"{len(data)}+" if consulta.hay_siguiente(0) else str(len(data))
+
+    def mostrar_totales(total_neto, total_descuento, cancelados):
+        totales_card.content = ft.Column([
+            ft.Row([ft.Text(f"Total Neto: ${total_neto:,.2f}", size=22, weight=ft.FontWeight.BOLD), descargarpdf_btn]),
+            ft.Text(f"Total Descuento: ${total_descuento:,.2f}", size=16, weight=ft.FontWeight.BOLD),
+            txt_encontrados,
+            ft.Text(f"Recibos cancelados: {cancelados}", size=14, color=ft.Colors.RED_700),
+            txt_seguimiento
+        ])
+
+    def params_recibos_actuales(nombre=""):
+        params = {"desde": fmt_api(txt_fecha_desde.data), "hasta": fmt_api(txt_fecha_hasta.data)}
+        if nombre:
+            params["contribuyente"] = nombre
+        return params
 
+    def mostrar_sin_recibos():
         resultado_card.content = ft.Column(
-            recibos_widgets + [ft.Row(botones_navegacion, alignment=ft.MainAxisAlignment.CENTER)],
+            [ft.Container(
+                content=ft.Row([ft.Icon(ft.Icons.SEARCH_OFF), ft.Text("Sin recibos en este rango.")]),
+                padding=10,
+                bgcolor=ft.Colors.GREY_100,
+                border_radius=10,
+            )],
             spacing=10, scroll=ft.ScrollMode.ALWAYS, height=200
         )
-        page.update()
 
-    def buscar_producto(nombre_raw):
-        buscar_btn.disabled = True
-        loader.visible = True
-        fecha_desde_btn.disabled = True
-        fecha_hasta_btn.disabled = True
-        desplegar_btn.visible = False
-        buscar_btn.width = 300
-        page.update()
-
-        desde_date = datetime.fromisoformat(txt_fecha_desde.data).date()
-        hasta_date = datetime.fromisoformat(txt_fecha_hasta.data).date()
-
-        desde = desde_date.strftime("%y%m%d")
-        hasta = hasta_date.strftime("%y%m%d")
-        params = {"desde": desde, "hasta": hasta}
-
-        nombre = nombre_raw.strip()
-        if nombre:
-            params["contribuyente"] = nombre
+    def contar_recibos(cantidad: int):
+        txt_encontrados.value = f"Recibos encontrados: {cantidad}"
+        if 0 < sesiones.MAX_FILAS < cantidad:
+            txt_encontrados.value += f" (se muestran los primeros {sesiones.MAX_FILAS})"
+
+    def mostrar_recibos_completos(data, continuar=False, repintar=True):
+        # Rango completo en memoria: los totales salen de aquí mismo.
+        # repintar=False: la lista ya muestra estas filas, solo se actualizan
+        # los totales.
+        nonlocal totales_recibos
+        totales_recibos = totales.totales_recibos(data)
+        contar_recibos(len(data))
+        mostrar_totales(totales_recibos.total_neto, totales_recibos.total_descuento, totales_recibos.cancelados)
+        verificar_totales()
+        if repintar:
+            mostrar_resultados(sesiones.recortar(data), continuar=continuar)
+
+    def verificar_totales():
+        # Si se tienen los totales locales y los del servidor para el mismo
+        # rango completo (sin filtro), deben cuadrar (ver totales.EXCLUIR_CANCELADOS)
+        if totales_recibos is None or totales_servidor is None or filtro_recibos:
+            return
+        params, d = totales_servidor
+        if params != params_recibos or "contribuyente" in params:
+            return
+        for aviso in totales.diferencias(totales_recibos, d):
+            print(f"[totales] no cuadran con recibos/totales {params}: {aviso}")
+
+    def refinar_recibos(nombre) -> bool:
+        # Si el texto nuevo solo acota lo que ya está cargado, se filtra en el
+        # cliente y no se va a la API.
+        nonlocal filtro_recibos
+        if base_recibos is None or not se_puede_refinar(params_recibos, params_recibos_actuales(nombre)):
+            return False
+        filtro_recibos = nombre
+        data = indice_recibos.buscar(nombre)
+        mostrar_recibos_completos(data)
+        if not data:
+            mostrar_sin_recibos()
+            page.update()
+            sugerir_parecidos(indice_recibos, nombre)
+        return True
+
+    async def cargar_recibos(params, nombre, forzar=False):
+        nonlocal totales_recibos, params_recibos, base_recibos, indice_recibos, filtro_recibos
+        # Lo pintado, para no repintar si la respuesta resulta ser la misma
+        mostradas = todos_los_recibos if consulta_recibos is None and not filtro_recibos else None
+        indice_previo = indice_recibos
+        totales_recibos = None
+        params_recibos = params
+        base_recibos = None
+        indice_recibos = None
+        filtro_recibos = ""
+        vigente = True    # los tramos que lleguen después de cancelar se ignoran
+        parciales = False
+
+        def al_avanzar(filas):
+            nonlocal parciales
+            if not vigente or (not parciales and sin_cambios(sesiones.recortar(filas), mostradas, completo=False)):
+                return
+            txt_encontrados.value = f"Recibos encontrados: {len(filas)}..."
+            mostrar_resultados(sesiones.recortar(filas), continuar=parciales)
+            parciales = True
 
-        data = []
         try:
-            url = f"{API_URL}recibos/filtrar" if "contribuyente" in params else f"{API_URL}recibos"
-            response = requests.get(url, params=params)
-            if response.status_code == 200:
-                data = response.json()
-                mostrar_resultados(data)
-                if not data:
-                    rango = f"{txt_fecha_desde.value} a {txt_fecha_hasta.value}"
-                    criterio = f" para '{nombre}'" if nombre else ""
-                    show_snack(f"No se encontraron recibos de {rango}{criterio}.", icon=ft.Icons.SEARCH_OFF,
-                               bg=ft.Colors.RED)
-                    resultado_card.content = ft.Column(
-                        [ft.Container(
-                            content=ft.Row([ft.Icon(ft.Icons.SEARCH_OFF), ft.Text("Sin recibos en este rango.")]),
-                            padding=10,
-                            bgcolor=ft.Colors.GREY_100,
-                            border_radius=10,
-                        )],
-                        spacing=10, scroll=ft.ScrollMode.ALWAYS, height=200
-                    )
-                    page.update()
+            endpoint = "recibos/filtrar" if "contribuyente" in params else "recibos"
+            data, consulta = await consultar_lista(endpoint, params, forzar, al_avanzar=al_avanzar)
+            vigente = False
+            loader.visible = False
+            if consulta is None:
+                # Todo revalidado (304): la lista pintada y su índice siguen valiendo
+                repintar = parciales or not sin_cambios(sesiones.recortar(data), mostradas)
+                if not repintar:
+                    data = conservar_mostradas(data, mostradas)
+                if not sesiones.excede(data):
+                    # Si excede el límite solo se conservan las filas visibles
+                    base_recibos = data
+                    indice_recibos = indice_previo if not repintar and indice_previo is not None \
+                        else indexar(data, ("contribuyente",))
+                loader_totales.visible = False
+                mostrar_recibos_completos(data, continuar=parciales, repintar=repintar)
+                iniciar_seguimiento(params, data)
             else:
-                print("Error:", response.status_code, response.json().get("detail"))
+                txt_encontrados.value = f"Recibos encontrados: {texto_encontrados(data, consulta)}"
+                mostrar_resultados(data, consulta)
+            sesion.registrar("recibos", todos_los_recibos)
+            if not data:
+                rango = f"{txt_fecha_desde.value} a {txt_fecha_hasta.value}"
+                criterio = f" para '{nombre}'" if nombre else ""
+                show_snack(f"No se encontraron recibos de {rango}{criterio}.", icon=ft.Icons.SEARCH_OFF,
+                           bg=ft.Colors.RED)
+                mostrar_sin_recibos()
+        except ErrorAPI as e:
+            print("Error:", e.status_code, e.detalle)
         except Exception as e:
             print("Error al buscar recibos:", str(e))
+        finally:
+            vigente = False
+        loader.visible = False
+        page.update()
 
+    async def cargar_totales(params, forzar=False):
+        nonlocal totales_servidor
         try:
-            response_totales = requests.get(f"{API_URL}recibos/totales", params=params)
-            if response_totales.status_code == 200:
-                d = response_totales.json()
-                totales_card.content = ft.Column([
-                    ft.Row([ft.Text(f"Total Neto: ${float(d.get('total_neto', 0)):,.2f}", size=22, weight=ft.FontWeight.BOLD), descargarpdf_btn]),
-                    ft.Text(f"Total Descuento: ${float(d.get('total_descuento', 0)):,.2f}", size=16, weight=ft.FontWeight.BOLD),
-                    ft.Text(f"Recibos encontrados: {len(data)}", size=14, color=ft.Colors.BLACK),
-                    ft.Text(f"Recibos cancelados: {d.get('cantidad_status_1', 0)}", size=14, color=ft.Colors.RED_700)
-                ])
+            d = await cliente_api.consultar("recibos/totales", params, cache, forzar)
+            totales_servidor = (params, d)
+            if totales_recibos is None:
+                mostrar_totales(float(d.get('total_neto', 0)), float(d.get('total_descuento', 0)),
+                                d.get('cantidad_status_1', 0))
+            else:
+                verificar_totales()
         except Exception as e:
             print("Error al obtener totales:", str(e))
+        loader_totales.visible = False
+        page.update()
 
-        loader.visible = False
-        buscar_btn.disabled = False
-        fecha_hasta_btn.disabled = False
-        fecha_desde_btn.disabled = False
-        buscar_btn.width = 150
-        desplegar_btn.visible = True
+    def detener_seguimiento():
+        nonlocal seguimiento_hoy, tarea_seguimiento
+        if tarea_seguimiento is not None:
+            tarea_seguimiento.cancel()
+        seguimiento_hoy = None
+        tarea_seguimiento = None
+        txt_seguimiento.visible = False
+
+    def iniciar_seguimiento(params, data):
+        # Rango que incluye hoy: desde ahora solo se piden los cambios del día
+        nonlocal seguimiento_hoy, tarea_seguimiento
+        detener_seguimiento()
+        if not seguimiento.ACTIVO or not seguimiento.incluye_hoy(params):
+            return
+        seguimiento_hoy = seguimiento.SeguimientoHoy(params, data)
+        tarea_seguimiento = page.run_task(seguir_hoy, seguimiento_hoy)
+
+    async def seguir_hoy(seg):
+        while seg.vigente():
+            txt_seguimiento.value = f"Actualización automática: {datetime.now(zona_horaria):%H:%M:%S}"
+            txt_seguimiento.visible = True
+            page.update()
+            await asyncio.sleep(seg.espera)
+            try:
+                nuevos, cambiados = await asyncio.to_thread(seg.consultar)
+            except Exception as e:
+                print("Error al actualizar los recibos de hoy:", str(e))
+                continue
+            if nuevos or cambiados:
+                aplicar_seguimiento(nuevos, cambiados)
+        txt_seguimiento.visible = False
         page.update()
 
-    def mostrar_despliegue_totales():
-        desde_date = datetime.fromisoformat(txt_fecha_desde.data).date()
-        hasta_date = datetime.fromisoformat(txt_fecha_hasta.data).date()
-        desde = desde_date.strftime("%y%m%d")
-        hasta = hasta_date.strftime("%y%m%d")
-        params = {"desde": desde, "hasta": hasta}
-        try:
-            response = requests.get(f"{API_URL}recibos/totales/despliegue", params=params)
-            if response.status_code == 200:
-                data = response.json()
-                if not data:
-                    desplegar_dialog.content = ft.Text("No se encontraron totales en este rango de fechas.")
-                    page.open(desplegar_dialog)
-                    return
+    def aplicar_seguimiento(nuevos, cambiados):
+        # Nuevos arriba y cancelaciones en su lugar, sin volver a pintar ni a
+        # sumar todo el día: solo se construyen las tarjetas que cambiaron.
+        nonlocal todos_los_recibos, base_recibos, indice_recibos
+        completos = base_recibos if base_recibos is not None else todos_los_recibos
+        actuales = {id(anterior): actual for anterior, actual in cambiados}
+        # Lista nueva: la anterior puede ser la de la caché (de solo lectura)
+        filas = nuevos + ([actuales.get(id(r), r) for r in completos] if actuales else completos)
+        if base_recibos is not None:
+            base_recibos = filas
+            indice_recibos = indexar(filas, ("contribuyente",))
+        if filtro_recibos:
+            # Refinado en el cliente: se vuelve a filtrar sobre la base al día
+            refinar_recibos(filtro_recibos)
+            return
+
+        for anterior, actual in cambiados:
+            totales_recibos.quitar(anterior)
+            totales_recibos.agregar(actual)
+        for r in nuevos:
+            totales_recibos.agregar(r)
+        visibles = sesiones.recortar(filas)
+        if componentes.LISTA_VIRTUAL:
+            for anterior, actual in cambiados:
+                lista_recibos.reemplazar(anterior, actual)
+            lista_recibos.anteponer(nuevos, visibles)
+            todos_los_recibos = visibles
+        else:
+            todos_los_recibos = visibles
+            mostrar_pagina()
+        # Con el límite de filas la lista está recortada: el total es el de los totales
+        contar_recibos(totales_recibos.cantidad)
+        mostrar_totales(totales_recibos.total_neto, totales_recibos.total_descuento, totales_recibos.cancelados)
+        sesion.registrar("recibos", todos_los_recibos)
+        page.update()
 
-                items = []
-                for cuenta_data in data:
-                    cuenta = cuenta_data.get("cuenta", "Sin cuenta")
-                    total_neto = cuenta_data.get("total_neto", 0.0)
-                    total_descuento = cuenta_data.get("total_descuento", 0.0)
+    async def buscar_producto(nombre_raw, forzar=False):
+        # La pantalla sigue activa: las filas llegan por tramos y se puede
+        # cancelar, buscar otra vez o cambiar las fechas a media consulta.
+        detener_seguimiento()
+        loader.visible = True
+        loader_totales.visible = True
+        cancelar_btn.visible = True
+        desplegar_btn.visible = False
+        buscar_btn.width = 300
+        txt_encontrados.value = "Recibos encontrados: ..."
+        if not todos_los_recibos:
+            resultado_card.content = componentes.esqueleto()
+        page.update()
 
-                    items.append(ft.Text(f"Cuenta: {cuenta}", size=18, weight=ft.FontWeight.BOLD))
-                    items.append(ft.Text(f"  Total Neto: ${total_neto:,.2f}", size=16))
-                    items.append(ft.Text(f"  Total Descuento: ${total_descuento:,.2f}", size=16))
-                    items.append(ft.Divider())
+        nombre = nombre_raw.strip()
+        params = params_recibos_actuales(nombre)
 
-                desplegar_dialog.content = ft.Column(items, height=400, scroll=ft.ScrollMode.ALWAYS)
-                page.open(desplegar_dialog)
+        with metricas.medir("busqueda", vista="recibos", **params) as medida:
+            try:
+                if paginacion.PAGINADO:
+                    # Solo se tendrá una página: los totales los da el servidor. Lista
+                    # y totales son independientes, se piden en paralelo y cada
+                    # tarjeta se pinta en cuanto llega su respuesta.
+                    await asyncio.gather(cargar_recibos(params, nombre, forzar), cargar_totales(params, forzar))
+                else:
+                    await cargar_recibos(params, nombre, forzar)
+                medida.datos["filas"] = len(todos_los_recibos)
+            finally:
+                # También si la búsqueda se cancela porque el usuario siguió escribiendo
+                loader.visible = False
+                loader_totales.visible = False
+                cancelar_btn.visible = False
+                buscar_btn.width = 150
+                desplegar_btn.visible = True
+                page.update()
+
+    async def buscar_con_espera(nombre_raw, forzar=False, en_vivo=False):
+        if en_vivo:
+            await asyncio.sleep(ESPERA_BUSQUEDA)
+            if refinar_recibos((nombre_raw or "").strip()):
+                return
+        await buscar_producto(nombre_raw or "", forzar)
+
+    def lanzar_busqueda(nombre_raw, forzar=False, en_vivo=False):
+        # Una búsqueda nueva cancela la anterior (en espera o en vuelo); la
+        # respuesta que llegue tarde se descarta.
+        nonlocal busqueda_en_curso
+        if busqueda_en_curso is not None:
+            busqueda_en_curso.cancel()
+        busqueda_en_curso = page.run_task(buscar_con_espera, nombre_raw, forzar, en_vivo)
+
+    async def mostrar_despliegue_totales():
+        params = params_recibos_actuales()
+        try:
+            if totales_recibos is not None and params_recibos == params and not filtro_recibos \
+                    and totales_recibos.tiene_cuentas():
+                # Mismo rango ya cargado completo y sin filtro: no hace falta ir a la API
+                data = totales_recibos.despliegue()
             else:
-                desplegar_dialog.content = ft.Text(f"Error al obtener datos: {response.status_code}")
+                data = await cliente_api.consultar("recibos/totales/despliegue", params, cache)
+            if not data:
+                desplegar_dialog.content = ft.Text("No se encontraron totales en este rango de fechas.")
                 page.open(desplegar_dialog)
+                return
+
+            items = []
+            for cuenta_data in data:
+                cuenta = cuenta_data.get("cuenta", "Sin cuenta")
+                total_neto = cuenta_data.get("total_neto", 0.0)
+                total_descuento = cuenta_data.get("total_descuento", 0.0)
+
+                items.append(ft.Text(f"Cuenta: {cuenta}", size=18, weight=ft.FontWeight.BOLD))
+                items.append(ft.Text(f"  Total Neto: ${total_neto:,.2f}", size=16))
+                items.append(ft.Text(f"  Total Descuento: ${total_descuento:,.2f}", size=16))
+                items.append(ft.Divider())
+
+            desplegar_dialog.content = ft.Column(items, height=400, scroll=ft.ScrollMode.ALWAYS)
+            page.open(desplegar_dialog)
+        except ErrorAPI as e:
+            desplegar_dialog.content = ft.Text(f"Error al obtener datos: {e.status_code}")
+            page.open(desplegar_dialog)
         except Exception as e:
             print("Error al obtener totales:", str(e))
             desplegar_dialog.content = ft.Text("Hubo un error al intentar obtener los datos.")
             page.open(desplegar_dialog)
 
+    def refrescar():
+        cache.invalidar("recibos", params_recibos_actuales())
+        lanzar_busqueda(contribuyente_input.value, forzar=True)
+
+    def cancelar_busqueda():
+        if en_curso(busqueda_en_curso):
+            busqueda_en_curso.cancel()
+            show_snack("Búsqueda cancelada.", icon=ft.Icons.CANCEL)
+
+    def liberar_recibos():
+        # Vista oculta: se sueltan las filas (los totales pintados se quedan)
+        nonlocal todos_los_recibos, consulta_recibos, base_recibos, indice_recibos, recibos_liberados
+        if recibos_liberados:
+            return
+        if busqueda_en_curso is not None:
+            busqueda_en_curso.cancel()
+        detener_seguimiento()
+        if consulta_recibos is not None:
+            consulta_recibos.cancelar()
+        todos_los_recibos = []
+        consulta_recibos = None
+        base_recibos = None
+        indice_recibos = None
+        lista_recibos.cargar([])
+        pool_recibos.mostrar([], False, False)
+        resultado_card.content = componentes.esqueleto()
+        recibos_liberados = True
+        sesion.registrar("recibos", [])
+
+    def recargar_recibos():
+        nonlocal recibos_liberados
+        if recibos_liberados:
+            recibos_liberados = False
+            lanzar_busqueda(contribuyente_input.value)
+
     # Acciones de botones (RECIBOS)
-    buscar_btn.on_click = lambda e: buscar_producto(contribuyente_input.value)
-    desplegar_btn.on_click = lambda e: mostrar_despliegue_totales()
+    buscar_btn.on_click = lambda e: lanzar_busqueda(contribuyente_input.value)
+    contribuyente_input.on_change = lambda e: lanzar_busqueda(contribuyente_input.value, en_vivo=True)
+    desplegar_btn.on_click = lambda e: page.run_task(mostrar_despliegue_totales)
+    refrescar_btn.on_click = lambda e: refrescar()
+    cancelar_btn.on_click = lambda e: cancelar_busqueda()
     cedulas_btn.on_click = lambda e: page.go("/cedulas")  # <--- NAVEGAR
 
     # ----------- ROUTING -----------
@@ -313,7 +756,7 @@ def main(page: ft.Page):
             route="/",
             controls=[
                 ft.Column(
-                    [encabezado, loader, totales_card, resultado_card],
+                    [encabezado, loader_totales, totales_card, loader, resultado_card],
                     spacing=20
                 )
             ],
@@ -325,14 +768,18 @@ def main(page: ft.Page):
 
         # --- Estado local de CÉDULAS ---
         c_todos = []
+        c_consulta = None  # solo en modo paginado
+        c_totales = None
+        c_base = None      # respuesta completa de c_params (para refinar sin red)
+        c_indice = None
+        c_params = None
+        c_busqueda_en_curso = None
+        c_liberados = False
         c_pagina = 0
         c_page_size = 100
 
         # --- Widgets GUI (idénticos, cambiando el título) ---
-        c_logo = ft.Image(
-            src="https://i.ibb.co/TqxbQnsq/Imagen-de-Whats-App-2025-04-23-a-las-10-14-29-559a5c08.jpg",
-            width=60, height=60, fit=ft.ImageFit.CONTAIN
-        )
+        c_logo = ft.Image(src=LOGO, width=60, height=60, fit=ft.ImageFit.CONTAIN)
         c_titulo_empresa = ft.Text("DZEMUL", size=26, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)
         c_titulo = ft.Text("Consulta de Cédulas", size=28, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE)
 
@@ -347,13 +794,12 @@ def main(page: ft.Page):
             txt.data = nueva_fecha
             txt.value = datetime.fromisoformat(nueva_fecha).strftime("%d-%m-%Y")
             page.update()
+            if en_curso(c_busqueda_en_curso):
+                c_lanzar_busqueda(c_contrib.value)
 
         c_dp_desde = ft.DatePicker(on_change=lambda e: c_actualizar_fecha(c_txt_desde, e.data), value=date.today())
         c_dp_hasta = ft.DatePicker(on_change=lambda e: c_actualizar_fecha(c_txt_hasta, e.data), value=date.today())
-        if c_dp_desde not in page.overlay:
-            page.overlay.append(c_dp_desde)
-        if c_dp_hasta not in page.overlay:
-            page.overlay.append(c_dp_hasta)
+        page.overlay.extend([c_dp_desde, c_dp_hasta])
 
         c_btn_desde = ft.ElevatedButton("Fecha desde", icon=ft.Icons.CALENDAR_MONTH,
                                         on_click=lambda e: page.open(c_dp_desde))
@@ -385,9 +831,19 @@ def main(page: ft.Page):
             on_click=lambda e: page.go("/")
         )
 
-        c_descargarpdf_btn = ft.ElevatedButton(
-            "Descargar PDF", width=150, height=40, icon=ft.Icons.DOWNLOAD,
-            bgcolor=ft.Colors.WHITE, color=ft.Colors.RED, icon_color=ft.Colors.RED
+        c_btn_refrescar = ft.IconButton(
+            icon=ft.Icons.REFRESH, icon_color=ft.Colors.WHITE, tooltip="Actualizar (ignora la caché)"
+        )
+        c_btn_cancelar = ft.IconButton(
+            icon=ft.Icons.CANCEL, icon_color=ft.Colors.WHITE, tooltip="Cancelar búsqueda", visible=False
+        )
+        c_btn_metricas = ft.IconButton(
+            icon=ft.Icons.SPEED, icon_color=ft.Colors.WHITE, tooltip="Métricas",
+            visible=metricas.ACTIVO, on_click=lambda e: mostrar_metricas()
+        )
+
+        c_descargarpdf_btn = componentes.boton_descargar(
+            lambda formato: page.run_task(c_exportar, formato), exportar.FORMATOS
         )
 
         c_dialog = ft.AlertDialog(title=ft.Text("Despliegue de Totales - Cédulas"))
@@ -402,7 +858,8 @@ def main(page: ft.Page):
                 c_titulo,
                 ft.Row([c_btn_desde, c_btn_hasta]),
                 ft.Row([c_txt_desde, c_txt_hasta]),
-                ft.Row([c_btn_buscar, c_btn_resumen], alignment=ft.MainAxisAlignment.START),
+                ft.Row([c_btn_buscar, c_btn_resumen, c_btn_refrescar, c_btn_cancelar, c_btn_metricas],
+                       alignment=ft.MainAxisAlignment.START),
                 c_btn_recibos,
                 c_contrib
             ]),
@@ -412,168 +869,288 @@ def main(page: ft.Page):
         )
 
         # --- Utilidades / Lógica (CÉDULAS) ---
-        def c_formatear_fecha_yymmdd(f):
-            try:
-                return datetime.strptime(f, "%y%m%d").strftime("%d-%m-%Y")
-            except Exception:
-                return f
-
-        def c_descargar_pdf(e):
-            desde = c_fmt_api(c_txt_desde.data)
-            hasta = c_fmt_api(c_txt_hasta.data)
+        async def c_exportar(formato):
             nombre = (c_contrib.value or "").strip()
-            if nombre:
-                url = f"{API_URL}cedulas/reporte?desde={desde}&hasta={hasta}&contribuyente={quote_plus(nombre)}"
+            params = c_params_actuales(nombre)
+            if c_base is not None and se_puede_refinar(c_params, params):
+                registros = c_indice.buscar(nombre)
             else:
-                url = f"{API_URL}cedulas/reporte?desde={desde}&hasta={hasta}"
-            page.launch_url(url)
-
-        c_descargarpdf_btn.on_click = c_descargar_pdf
+                endpoint = "cedulas/filtrar" if nombre else "cedulas"
+                registros = paginacion.iterar_registros(endpoint, params, modelos.decodificar_cedulas)
+            titulo = f"Cédulas del {c_txt_desde.value} al {c_txt_hasta.value}"
+            if nombre:
+                titulo += f" - {nombre}"
+            archivo = f"cedulas_{params['desde']}_{params['hasta']}.{formato}"
+            await guardar_exportacion(archivo, formato, "cedulas", titulo, registros)
 
         def c_fmt_api(iso_date_str: str) -> str:
             d = datetime.fromisoformat(iso_date_str).date()
             return d.strftime("%y%m%d")
 
+        c_lista = componentes.ListaVirtual(
+            componentes.TarjetaCedula, componentes.EXTENSION_CEDULA
+        )
+        c_pool = componentes.PoolTarjetas(
+            componentes.TarjetaCedula, lambda: c_cambiar_pagina(-1), lambda: c_cambiar_pagina(1), c_page_size
+        )
+
         def c_mostrar_pagina():
             nonlocal c_pagina, c_page_size, c_todos
-            inicio = c_pagina * c_page_size
-            fin = inicio + c_page_size
-            fragmento = c_todos[inicio:fin]
-
-            widgets = []
-            for r in fragmento:
-                folio = r.get("folio", "")
-                motivo = r.get("motivo", "")
-                fecham = r.get("fecham", "")
-                contrib = r.get("contribuyente", "")
-                direccion = r.get("direccion") or ""  # puede venir None
-                precio_unitario = float(r.get("precio_unitario") or 0)
-                cantidad = float(r.get("cantidad") or 0)
-                importe = precio_unitario * cantidad
-                recibo_teso = r.get("recibo_teso") or None
-                fecha_rteso = r.get("fecha_rteso") or None
-                folio_elec = r.get("folio_electronico") or "Sin folio"
-
-
-
-                tarjeta = ft.Card(
-                    content=ft.Container(
-                        content=ft.Column([
-                            ft.Text(f"Cédula: {folio}", weight=ft.FontWeight.BOLD, size=18),
-                            ft.Text(f"Motivo: {motivo}"),
-                            ft.Text(f"Folio electronico: {folio_elec}"),
-                            ft.Text(f"Contribuyente: {contrib}"),
-                            ft.Text(f"Dirección: {direccion}", selectable=True),
-                            ft.Text(f"Fecha: {c_formatear_fecha_yymmdd(fecham)}"),
-                            ft.Text(f"Importe: ${importe}"),
-                            ft.Text(f"Recibo: {recibo_teso if recibo_teso != None else "Sin recibo"}"),
-                            ft.Text(f"Fecha recibo: {c_formatear_fecha_yymmdd(fecha_rteso) if recibo_teso != None else "Sin recibo"}")
-                        ]),
-                        padding=15,
-                        bgcolor=ft.Colors.WHITE,
-                        border_radius=10,
-                        shadow=ft.BoxShadow(blur_radius=8, color=ft.Colors.GREY_400, offset=ft.Offset(2, 2))
-                    ),
-                    elevation=2
-                )
-                widgets.append(tarjeta)
-
-            nav = []
-            if c_pagina > 0:
-                nav.append(ft.ElevatedButton("⬅️ Anteriores 100", on_click=lambda e: c_cambiar_pagina(-1)))
-            if fin < len(c_todos):
-                nav.append(ft.ElevatedButton("Siguientes 100 ➡️", on_click=lambda e: c_cambiar_pagina(1)))
+            if c_consulta is not None:
+                fragmento = c_consulta.filas(c_pagina)
+                hay_siguiente = c_consulta.hay_siguiente(c_pagina)
+            else:
+                inicio = c_pagina * c_page_size
+                fin = inicio + c_page_size
+                fragmento = c_todos[inicio:fin]
+                hay_siguiente = fin < len(c_todos)
 
-            c_resultado_card.content = ft.Column(
-                widgets + [ft.Row(nav, alignment=ft.MainAxisAlignment.CENTER)],
-                spacing=10, scroll=ft.ScrollMode.ALWAYS, height=200
-            )
+            c_pool.mostrar(fragmento, c_pagina > 0, hay_siguiente)
+            c_resultado_card.content = c_pool.columna
             page.update()
 
         def c_cambiar_pagina(delta: int):
             nonlocal c_pagina
             c_pagina += delta
+            if c_consulta is not None:
+                page.run_task(c_cargar_pagina)
+            else:
+                c_mostrar_pagina()
+
+        async def c_cargar_pagina():
+            c_loader.visible = True
+            page.update()
+            try:
+                await c_consulta.cargar(c_pagina)
+            except Exception as e:
+                print("Error al cargar página de cédulas:", str(e))
+            c_loader.visible = False
             c_mostrar_pagina()
 
-        def c_mostrar_resultados(data):
-            nonlocal c_todos, c_pagina
+        def c_mostrar_resultados(data, consulta=None, continuar=False):
+            nonlocal c_todos, c_consulta, c_pagina
+            if c_consulta is not None:
+                c_consulta.cancelar()
             c_todos = data or []
-            c_pagina = 0
-            c_mostrar_pagina()
+            c_consulta = consulta
+            if not continuar:
+                c_pagina = 0
+            if componentes.LISTA_VIRTUAL and continuar:
+                c_lista.ampliar(c_todos)
+                c_resultado_card.content = c_lista.vista
+                page.update()
+            elif componentes.LISTA_VIRTUAL:
+                c_lista.cargar(c_todos, c_siguiente_pagina if consulta is not None else None)
+                c_resultado_card.content = c_lista.vista
+                page.update()
+            else:
+                c_mostrar_pagina()
 
-        def c_buscar(nombre_raw: str):
-            # Activa loader / desactiva botones
-            c_btn_buscar.disabled = True
+        async def c_siguiente_pagina():
+            nonlocal c_pagina
+            if c_consulta is None or not c_consulta.hay_siguiente(c_pagina):
+                return []
+            c_pagina += 1
+            await c_consulta.cargar(c_pagina)
+            return c_consulta.filas(c_pagina)
+
+        def c_params_actuales(nombre=""):
+            # Params con formato aammdd
+            params = {"desde": c_fmt_api(c_txt_desde.data), "hasta": c_fmt_api(c_txt_hasta.data)}
+            if nombre:
+                params["contribuyente"] = nombre
+            return params
+
+        def c_mostrar_sin_resultados():
+            c_resultado_card.content = ft.Column(
+                [ft.Container(
+                    content=ft.Row([ft.Icon(ft.Icons.SEARCH_OFF), ft.Text("Sin cédulas en este rango.")]),
+                    padding=10,
+                    bgcolor=ft.Colors.GREY_100,
+                    border_radius=10,
+                )],
+                spacing=10, scroll=ft.ScrollMode.ALWAYS, height=200
+            )
+
+        def c_mostrar_totales(data, encontrados):
+            # Totales calculados sobre las cédulas descargadas (no hay /cedulas/totales)
+            nonlocal c_totales
+            c_totales = totales.totales_cedulas(data)
+            parcial = " (solo la primera página)" if c_consulta is not None else ""
+            c_totales_card.content = ft.Column([
+                ft.Row([ft.Text(f"Importe total: ${c_totales.importe:,.2f}{parcial}", size=22, weight=ft.FontWeight.BOLD),
+                        c_descargarpdf_btn]),
+                ft.Text(f"Pagadas: {c_totales.pagadas} (${c_totales.importe_pagadas:,.2f})", size=16,
+                        weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_800),
+                ft.Text(f"Sin pagar: {c_totales.pendientes} (${c_totales.importe_pendientes:,.2f})", size=16,
+                        weight=ft.FontWeight.BOLD, color=ft.Colors.RED_700),
+                ft.Text(f"Cédulas encontradas: {encontrados}", size=14, color=ft.Colors.BLACK)
+            ])
+            c_btn_resumen.visible = c_totales.cantidad > 0
+
+        def c_refinar(nombre) -> bool:
+            # Igual que refinar_recibos: acotar en el cliente lo ya cargado
+            if c_base is None or not se_puede_refinar(c_params, c_params_actuales(nombre)):
+                return False
+            data = c_indice.buscar(nombre)
+            c_mostrar_resultados(data)
+            c_mostrar_totales(data, str(len(data)))
+            if not data:
+                c_mostrar_sin_resultados()
+            page.update()
+            if not data:
+                sugerir_parecidos(c_indice, nombre)
+            return True
+
+        async def c_buscar(nombre_raw: str, forzar=False):
+            nonlocal c_base, c_indice, c_params
+            # Activa loader; los botones siguen activos (ver buscar_producto)
             c_loader.visible = True
-            c_btn_desde.disabled = True
-            c_btn_hasta.disabled = True
+            c_btn_cancelar.visible = True
             c_btn_resumen.visible = False
             c_btn_buscar.width = 300
+            if not c_todos:
+                c_resultado_card.content = componentes.esqueleto()
             page.update()
 
-            # Params con formato aammdd
-            desde = c_fmt_api(c_txt_desde.data)  # YYMMDD
-            hasta = c_fmt_api(c_txt_hasta.data)  # YYMMDD
-            params = {"desde": desde, "hasta": hasta}
-
             # Filtro por contribuyente: si hay texto, usamos /cedulas/filtrar
             nombre = (nombre_raw or "").strip()
             use_filter = len(nombre) > 0
-            if use_filter:
-                params["contribuyente"] = nombre
+            params = c_params_actuales(nombre)
+            # Lo pintado, para no repintar si la respuesta resulta ser la misma
+            mostradas = c_todos if c_consulta is None else None
+            indice_previo = c_indice
+            c_base = None
+            c_indice = None
+            c_params = params
 
             data = []
-            try:
-                url = f"{API_URL}cedulas/filtrar" if use_filter else f"{API_URL}cedulas"
-                response = requests.get(url, params=params)
-                if response.status_code == 200:
-                    data = response.json()
-                    c_mostrar_resultados(data)
+            encontrados = "0"
+            vigente = True
+            parciales = False
+
+            def al_avanzar(filas):
+                nonlocal parciales
+                if vigente and (parciales or not sin_cambios(sesiones.recortar(filas), mostradas, completo=False)):
+                    c_mostrar_resultados(sesiones.recortar(filas), continuar=parciales)
+                    parciales = True
+
+            with metricas.medir("busqueda", vista="cedulas", **params) as medida:
+                try:
+                    endpoint = "cedulas/filtrar" if use_filter else "cedulas"
+                    data, consulta = await consultar_lista(endpoint, params, forzar, c_page_size, al_avanzar)
+                    vigente = False
+                    # Todo revalidado (304): la lista y su índice siguen valiendo
+                    repintar = consulta is not None or parciales or not sin_cambios(sesiones.recortar(data), mostradas)
+                    if not repintar:
+                        data = conservar_mostradas(data, mostradas)
+                    if consulta is None and not sesiones.excede(data):
+                        c_base = data
+                        c_indice = indice_previo if not repintar and indice_previo is not None \
+                            else indexar(data, ("contribuyente", "direccion", "motivo"))
+                    encontrados = texto_encontrados(data, consulta)
+                    if consulta is None and sesiones.excede(data):
+                        encontrados += f" (se muestran las primeras {sesiones.MAX_FILAS})"
+                    if repintar:
+                        c_mostrar_resultados(sesiones.recortar(data), consulta, continuar=parciales)
+                    medida.datos["filas"] = len(data)
+                    sesion.registrar("cedulas", c_todos)
                     # Aviso si no hay resultados
-                if not data:
-                    rango = f"{c_txt_desde.value} a {c_txt_hasta.value}"
-                    criterio = f" para '{nombre}'" if use_filter else ""
-                    show_snack(f"No se encontraron cédulas de {rango}{criterio}.", icon=ft.Icons.SEARCH_OFF, bg=ft.Colors.RED)
-                    c_resultado_card.content = ft.Column(
-                        [ft.Container(
-                            content=ft.Row([ft.Icon(ft.Icons.SEARCH_OFF), ft.Text("Sin cédulas en este rango.")]),
-                            padding=10,
-                            bgcolor=ft.Colors.GREY_100,
-                            border_radius=10,
-                        )],
-                        spacing=10, scroll=ft.ScrollMode.ALWAYS, height=200
-                    )
-                else:
-                    print("Error:", response.status_code, getattr(response, "text", ""))
-                    page.snack_bar = ft.SnackBar(ft.Text(f"Error {response.status_code} al consultar cédulas."))
-                    page.snack_bar.open = True
-            except Exception as e:
-                print("Error al buscar cédulas:", str(e))
-                page.snack_bar = ft.SnackBar(ft.Text("No se pudo consultar cédulas (revisa conexión/servidor)."))
-                page.snack_bar.open = True
-                show_snack("No se pudo consultar cédulas (revisa conexión/servidor).")
-
-            # Totales: placeholder (si luego expones /cedulas/totales lo integramos)
-            c_totales_card.content = ft.Column([
-                ft.Row([ft.Text(f"Cédulas encontradas: {len(data)}", size=14, color=ft.Colors.BLACK), c_descargarpdf_btn])
-            ])
+                    if not data:
+                        rango = f"{c_txt_desde.value} a {c_txt_hasta.value}"
+                        criterio = f" para '{nombre}'" if use_filter else ""
+                        show_snack(f"No se encontraron cédulas de {rango}{criterio}.", icon=ft.Icons.SEARCH_OFF, bg=ft.Colors.RED)
+                        c_mostrar_sin_resultados()
+                except ErrorAPI as e:
+                    print("Error:", e.status_code, e.detalle)
+                    medida.datos["error"] = e.status_code
+                    show_snack(f"Error {e.status_code} al consultar cédulas.")
+                except Exception as e:
+                    print("Error al buscar cédulas:", str(e))
+                    medida.datos["error"] = type(e).__name__
+                    show_snack("No se pudo consultar cédulas (revisa conexión/servidor).")
+                finally:
+                    # Restaurar UI (también si la búsqueda se cancela)
+                    vigente = False
+                    c_loader.visible = False
+                    c_btn_cancelar.visible = False
+                    c_btn_buscar.width = 150
+                    page.update()
 
-            # Restaurar UI
-            c_loader.visible = False
-            c_btn_buscar.disabled = False
-            c_btn_hasta.disabled = False
-            c_btn_desde.disabled = False
-            c_btn_buscar.width = 300
-            c_btn_resumen.visible = False
+            c_mostrar_totales(data, encontrados)
             page.update()
 
+        async def c_buscar_con_espera(nombre_raw, forzar=False, en_vivo=False):
+            if en_vivo:
+                await asyncio.sleep(ESPERA_BUSQUEDA)
+                if c_refinar((nombre_raw or "").strip()):
+                    return
+            await c_buscar(nombre_raw, forzar)
+
+        def c_lanzar_busqueda(nombre_raw, forzar=False, en_vivo=False):
+            nonlocal c_busqueda_en_curso
+            if c_busqueda_en_curso is not None:
+                c_busqueda_en_curso.cancel()
+            c_busqueda_en_curso = page.run_task(c_buscar_con_espera, nombre_raw, forzar, en_vivo)
+
         def c_mostrar_despliegue_totales():
-            # ESQUELETO: agrega tu llamada cuando exista /cedulas/totales (o similar)
-            c_dialog.content = ft.Text("Despliegue de totales de cédulas (pendiente de API).")
+            if c_totales is None or not c_totales.cantidad:
+                c_dialog.content = ft.Text("No se encontraron cédulas en este rango de fechas.")
+                page.open(c_dialog)
+                return
+
+            items = []
+            for motivo, cantidad, importe in c_totales.despliegue():
+                items.append(ft.Text(f"Motivo: {motivo}", size=18, weight=ft.FontWeight.BOLD))
+                items.append(ft.Text(f"  Cédulas: {cantidad}", size=16))
+                items.append(ft.Text(f"  Importe: ${importe:,.2f}", size=16))
+                items.append(ft.Divider())
+            items.append(ft.Text(f"Pagadas: {c_totales.pagadas} (${c_totales.importe_pagadas:,.2f})", size=16))
+            items.append(ft.Text(f"Sin pagar: {c_totales.pendientes} (${c_totales.importe_pendientes:,.2f})", size=16))
+
+            c_dialog.content = ft.Column(items, height=400, scroll=ft.ScrollMode.ALWAYS)
             page.open(c_dialog)
 
+        def c_refrescar():
+            cache.invalidar("cedulas", c_params_actuales())
+            c_lanzar_busqueda(c_contrib.value, forzar=True)
+
+        def c_cancelar_busqueda():
+            if en_curso(c_busqueda_en_curso):
+                c_busqueda_en_curso.cancel()
+                show_snack("Búsqueda cancelada.", icon=ft.Icons.CANCEL)
+
+        def c_liberar():
+            # Igual que liberar_recibos
+            nonlocal c_todos, c_consulta, c_base, c_indice, c_liberados
+            if c_liberados:
+                return
+            if c_busqueda_en_curso is not None:
+                c_busqueda_en_curso.cancel()
+            if c_consulta is not None:
+                c_consulta.cancelar()
+            c_todos = []
+            c_consulta = None
+            c_base = None
+            c_indice = None
+            c_lista.cargar([])
+            c_pool.mostrar([], False, False)
+            c_resultado_card.content = componentes.esqueleto()
+            c_liberados = True
+            sesion.registrar("cedulas", [])
+
+        def c_recargar():
+            nonlocal c_liberados
+            # Solo si ya se había consultado algo antes de ocultarla
+            if c_liberados and c_params is not None:
+                c_liberados = False
+                c_lanzar_busqueda(c_contrib.value)
+
         # Bind acciones
-        c_btn_buscar.on_click = lambda e: c_buscar(c_contrib.value)
+        c_btn_buscar.on_click = lambda e: c_lanzar_busqueda(c_contrib.value)
+        c_contrib.on_change = lambda e: c_lanzar_busqueda(c_contrib.value, en_vivo=True)
+        c_btn_refrescar.on_click = lambda e: c_refrescar()
+        c_btn_cancelar.on_click = lambda e: c_cancelar_busqueda()
         c_btn_resumen.on_click = lambda e: c_mostrar_despliegue_totales()
 
         # Armar vista
@@ -588,13 +1165,35 @@ def main(page: ft.Page):
 
         # Carga inicial vacía
         c_mostrar_resultados([])
+        ciclo_vista["/cedulas"] = (c_liberar, c_recargar)
         return view
+    # Cada vista se construye una sola vez por sesión y se reutiliza, así
+    # conserva sus resultados y no se duplican los DatePicker del overlay.
+    vistas = {}
+    constructores_vista = {"/": build_home_view, "/cedulas": build_cedulas_view}
+    # ruta -> (liberar, recargar): una vista oculta conserva sus filas; solo
+    # se sueltan al desconectarse o con memoria escasa (ver sesiones) y se
+    # vuelven a consultar (caché / almacén local) cuando se muestra otra vez
+    ciclo_vista = {"/": (liberar_recibos, recargar_recibos)}
+
+    def obtener_vista(ruta: str) -> ft.View:
+        if ruta not in vistas:
+            vistas[ruta] = constructores_vista[ruta]()
+        return vistas[ruta]
+
     def route_change(e: ft.RouteChangeEvent | None):
         # Redibuja las views según la ruta actual
         page.views.clear()
-        page.views.append(build_home_view())
+        page.views.append(obtener_vista("/"))
         if page.route == "/cedulas":
-            page.views.append(build_cedulas_view())
+            page.views.append(obtener_vista("/cedulas"))
+        visible = page.views[-1].route
+        liberar_ocultas = sesiones.LIBERAR_OCULTAS or sesiones.bajo_presion()
+        for ruta, (liberar, recargar) in ciclo_vista.items():
+            if ruta == visible:
+                recargar()
+            elif liberar_ocultas:
+                liberar()
         page.update()
 
     def view_pop(e: ft.ViewPopEvent):
@@ -602,10 +1201,33 @@ def main(page: ft.Page):
         top_view = page.views[-1]
         page.go(top_view.route)
 
+    def on_disconnect(e):
+        # Pestaña cerrada o sin red: se sueltan los datos hasta que vuelva
+        for liberar, _ in ciclo_vista.values():
+            liberar()
+
+    def on_connect(e):
+        if page.views and page.views[-1].route in ciclo_vista:
+            ciclo_vista[page.views[-1].route][1]()
+
+    def on_close(e):
+        # La sesión expiró: no queda nada que pintar
+        on_disconnect(e)
+        vistas.clear()
+        ciclo_vista.clear()
+        page.overlay.clear()
+        sesiones.cerrar(sesion)
+
     page.on_route_change = route_change
     page.on_view_pop = view_pop
+    page.on_disconnect = on_disconnect
+    page.on_connect = on_connect
+    page.on_close = on_close
 
-    buscar_producto("")       # para que al abrir ya cargue algo en /
-    page.go(page.route)       # dispara route_change con la ruta actual ("/" por defecto)
+    # Dispara route_change con la ruta actual ("/" por defecto). Al mostrarse
+    # Recibos (recibos_liberados) se lanza la primera consulta en segundo
+    # plano: la pantalla ya está pintada con el esqueleto y no espera a la red.
+    page.go(page.route)
 
-ft.app(target=main)
+if __name__ == "__main__":
+    ft.app(target=main)
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Mediciones de los puntos calientes (HTTP, decodificación, armado de
+# tarjetas, page.update, búsqueda completa). Con METRICAS=1 cada medición se
+# escribe como una línea JSON en la salida (y en METRICAS_ARCHIVO, si se
+# indica) y queda en memoria para el panel de depuración de la app. Apagado
+# (por defecto) medir() devuelve siempre el mismo objeto vacío.
+#
+#   with metricas.medir("http", endpoint="recibos") as m:
+#       ...
+#       m.datos["bytes"] = n
+
+ACTIVO = os.getenv("METRICAS", "0") == "1"
+ARCHIVO = os.getenv("METRICAS_ARCHIVO") or None
+RECIENTES_MAX = 200
+
+
+class _Nula:
+    datos = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULA = _Nula()
+
+
+class Medida:
+    __slots__ = ("nombre", "datos", "inicio", "ms")
+
+    def __init__(self, nombre: str, datos: dict):
+        self.nombre = nombre
+        self.datos = datos
+        self.inicio = 0.0
+        self.ms = 0.0
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.ms = (time.perf_counter() - self.inicio) * 1000
+        if tipo is not None:
+            self.datos["error"] = tipo.__name__
+        registrar(self)
+        return False
+
+
+def medir(nombre: str, **datos):
+    if not ACTIVO:
+        return _NULA
+    return Medida(nombre, datos)
+
+
+def envolver(nombre: str, funcion):
+    # Versión medida de una función (p. ej. page.update); sin cambios si está apagado
+    if not ACTIVO:
+        return funcion
+
+    def medida(*args, **kwargs):
+        with medir(nombre):
+            return funcion(*args, **kwargs)
+
+    return medida
+
+
+recientes = deque(maxlen=RECIENTES_MAX)
+_acumulado = {}  # nombre -> [veces, ms total, ms máximo]
+_lock = threading.Lock()
+
+
+def registrar(m: Medida):
+    registro = {"t": round(time.time(), 3), "medida": m.nombre, "ms": round(m.ms, 2), **m.datos}
+    linea = json.dumps(registro, ensure_ascii=False, default=str)
+    with _lock:
+        recientes.append(registro)
+        acumulado = _acumulado.setdefault(m.nombre, [0, 0.0, 0.0])
+        acumulado[0] += 1
+        acumulado[1] += m.ms
+        acumulado[2] = max(acumulado[2], m.ms)
+        if ARCHIVO:
+            with open(ARCHIVO, "a", encoding="utf-8") as f:
+                f.write(linea + "\n")
+    print("[metrica]", linea)
+
+
+def resumen() -> list:
+    # [(nombre, veces, ms promedio, ms máximo)] para el panel de depuración
+    with _lock:
+        return [(nombre, n, total / n, maximo) for nombre, (n, total, maximo) in sorted(_acumulado.items())]
+
+
+def ultimas(n: int = 30) -> list:
+    with _lock:
+        return list(recientes)[-n:]
@@ -0,0 +1,139 @@
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+# Decodificación de las respuestas de la API: cada fila se convierte una sola
+# vez en un registro compacto (con __slots__) con fechas y montos ya
+# interpretados. Los renderizadores solo formatean.
+
+CERO = Decimal("0")
+
+
+def parse_fecha(valor):
+    # "YYMMDD" (formato de la API) o ISO "YYYY-MM-DD"; None si no se puede
+    if not valor:
+        return None
+    if isinstance(valor, datetime):
+        # Columnas DATETIME (origen MySQL): solo interesa el día
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor).strip()
+    for formato in ("%y%m%d", "%Y-%m-%d"):
+        try:
+            return datetime.strptime(texto[:10], formato).date()
+        except ValueError:
+            pass
+    return None
+
+
+def parse_monto(valor) -> Decimal:
+    if valor is None or valor == "":
+        return CERO
+    try:
+        return Decimal(str(valor))
+    except InvalidOperation:
+        raise ValueError(f"Monto inválido: {valor!r}")
+
+
+def parse_recibo(valor):
+    # Los números de recibo son enteros (la API los manda como número, el
+    # almacén local y otros orígenes como texto); se dejan como int para
+    # compararlos y ordenarlos igual vengan de donde vengan.
+    texto = str(valor).strip()
+    return int(texto) if texto.isdigit() else texto
+
+
+class Recibo:
+    __slots__ = ("recibo", "contribuyente", "concepto", "fecha", "neto", "descuento", "cuenta", "cancelado")
+
+    def __init__(self, recibo, contribuyente, concepto, fecha, neto, descuento, cuenta, cancelado):
+        self.recibo = recibo
+        self.contribuyente = contribuyente
+        self.concepto = concepto
+        self.fecha = fecha
+        self.neto = neto
+        self.descuento = descuento
+        self.cuenta = cuenta
+        self.cancelado = cancelado
+
+    @classmethod
+    def desde_json(cls, r: dict) -> "Recibo":
+        return cls(
+            recibo=parse_recibo(r["recibo"]),
+            contribuyente=r.get("contribuyente") or "",
+            concepto=r.get("concepto") or "",
+            fecha=parse_fecha(r.get("fecha")),
+            neto=parse_monto(r.get("neto")),
+            descuento=parse_monto(r.get("descuento")),
+            cuenta=r.get("cuenta"),
+            cancelado=str(r.get("status", r.get("id_status", "0"))) == "1",
+        )
+
+
+class Cedula:
+    __slots__ = ("folio", "motivo", "folio_electronico", "contribuyente", "direccion", "fecham",
+                 "importe", "recibo_teso", "fecha_rteso")
+
+    def __init__(self, folio, motivo, folio_electronico, contribuyente, direccion, fecham,
+                 importe, recibo_teso, fecha_rteso):
+        self.folio = folio
+        self.motivo = motivo
+        self.folio_electronico = folio_electronico
+        self.contribuyente = contribuyente
+        self.direccion = direccion
+        self.fecham = fecham
+        self.importe = importe
+        self.recibo_teso = recibo_teso
+        self.fecha_rteso = fecha_rteso
+
+    @property
+    def pagada(self) -> bool:
+        return self.recibo_teso is not None
+
+    @classmethod
+    def desde_json(cls, r: dict) -> "Cedula":
+        return cls(
+            folio=r.get("folio", ""),
+            motivo=r.get("motivo") or "",
+            folio_electronico=r.get("folio_electronico") or None,
+            contribuyente=r.get("contribuyente") or "",
+            direccion=r.get("direccion") or "",  # puede venir None
+            fecham=parse_fecha(r.get("fecham")),
+            importe=parse_monto(r.get("precio_unitario")) * parse_monto(r.get("cantidad")),
+            recibo_teso=r.get("recibo_teso") or None,
+            fecha_rteso=parse_fecha(r.get("fecha_rteso")),
+        )
+
+
+def iguales(a, b) -> bool:
+    # Mismo tipo y mismos valores campo por campo (los registros no definen __eq__)
+    return type(a) is type(b) and all(getattr(a, c) == getattr(b, c) for c in a.__slots__)
+
+
+def _decodificar(filas, clase, nombre: str) -> list:
+    registros = []
+    invalidas = 0
+    for r in filas or []:
+        try:
+            registros.append(clase.desde_json(r))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            invalidas += 1
+    if invalidas:
+        print(f"Se omitieron {invalidas} {nombre} con datos inválidos")
+    return registros
+
+
+def decodificar_recibos(filas) -> list:
+    return _decodificar(filas, Recibo, "recibos")
+
+
+def decodificar_cedulas(filas) -> list:
+    return _decodificar(filas, Cedula, "cédulas")
+
+
+DECODIFICADORES = {
+    "recibos": decodificar_recibos,
+    "recibos/filtrar": decodificar_recibos,
+    "cedulas": decodificar_cedulas,
+    "cedulas/filtrar": decodificar_cedulas,
+}
@@ -0,0 +1,188 @@
+import json
+import os
+import queue
+import sys
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import pymysql
+import pymysql.cursors
+
+import metricas
+
+# Origen de datos directo a MySQL (ORIGEN_DATOS=mysql), para instalaciones en
+# la misma red que la base: evita el salto HTTP y el JSON de ida y vuelta.
+# Devuelve lo mismo que la API (filas como dict con los mismos nombres de
+# campo), así que caché, tramos, almacén local y decodificadores no cambian.
+#
+# Las consultas son por rango de fecha con parámetros; conviene tener índice
+# en recibos(fecha) y cedulas(fecham). Los nombres de tablas y columnas de
+# CONSULTAS siguen los campos que entrega la API; si el esquema difiere se
+# pueden reemplazar con DB_CONSULTAS=ruta/a/consultas.json ({endpoint: sql}).
+# Las filas se leen con cursor del lado del servidor (SSDictCursor), por lotes.
+#
+# DB_FECHAS dice cómo están guardadas las fechas: "aammdd" (por defecto, texto
+# como las maneja la app y la API) o "date" (columnas DATE/DATETIME).
+
+HOST = os.getenv("DB_HOST", "localhost")
+PUERTO = int(os.getenv("DB_PUERTO", "3306"))
+USUARIO = os.getenv("DB_USUARIO", "")
+CLAVE = os.getenv("DB_CLAVE", "")
+BASE = os.getenv("DB_NOMBRE", "")
+TAMANIO_POOL = int(os.getenv("DB_POOL", "5"))
+TIMEOUT = int(os.getenv("DB_TIMEOUT", "10"))
+FECHAS = os.getenv("DB_FECHAS", "aammdd")
+TAMANIO_LOTE = 1000
+
+_RECIBOS = ("SELECT recibo, contribuyente, concepto, fecha, neto, descuento, cuenta, status "
+            "FROM recibos WHERE fecha BETWEEN %(desde)s AND %(hasta)s")
+_CEDULAS = ("SELECT folio, motivo, folio_electronico, contribuyente, direccion, fecham, "
+            "precio_unitario, cantidad, recibo_teso, fecha_rteso "
+            "FROM cedulas WHERE fecham BETWEEN %(desde)s AND %(hasta)s")
+_FILTRO = " AND contribuyente LIKE %(contribuyente)s"
+
+CONSULTAS = {
+    "recibos": _RECIBOS + " ORDER BY fecha, recibo",
+    "recibos/filtrar": _RECIBOS + _FILTRO + " ORDER BY fecha, recibo",
+    # status NULL cuenta como no cancelado, igual que en modelos.Recibo
+    "recibos/totales": (
+        "SELECT COALESCE(SUM(CASE WHEN COALESCE(status, 0) <> 1 THEN neto END), 0) AS total_neto, "
+        "COALESCE(SUM(CASE WHEN COALESCE(status, 0) <> 1 THEN descuento END), 0) AS total_descuento, "
+        "COUNT(CASE WHEN COALESCE(status, 0) = 1 THEN 1 END) AS cantidad_status_1 "
+        "FROM recibos WHERE fecha BETWEEN %(desde)s AND %(hasta)s"
+    ),
+    "recibos/totales/despliegue": (
+        "SELECT cuenta, SUM(neto) AS total_neto, SUM(descuento) AS total_descuento "
+        "FROM recibos WHERE fecha BETWEEN %(desde)s AND %(hasta)s AND COALESCE(status, 0) <> 1 "
+        "GROUP BY cuenta ORDER BY cuenta"
+    ),
+    "cedulas": _CEDULAS + " ORDER BY fecham, folio",
+    "cedulas/filtrar": _CEDULAS + _FILTRO + " ORDER BY fecham, folio",
+}
+# Endpoints que devuelven un solo objeto en lugar de un arreglo
+OBJETOS = {"recibos/totales"}
+
+if os.getenv("DB_CONSULTAS"):
+    with open(os.environ["DB_CONSULTAS"], encoding="utf-8") as f:
+        CONSULTAS.update(json.load(f))
+
+
+class _Pool:
+    """Conexiones reutilizables; si todas están ocupadas se espera a que se libere una."""
+
+    def __init__(self, tamanio: int):
+        self._libres = queue.LifoQueue()
+        self._disponibles = threading.Semaphore(tamanio)
+
+    def _conectar(self):
+        return pymysql.connect(
+            host=HOST, port=PUERTO, user=USUARIO, password=CLAVE, database=BASE,
+            charset="utf8mb4", autocommit=True, connect_timeout=TIMEOUT, read_timeout=TIMEOUT * 6,
+        )
+
+    @contextmanager
+    def conexion(self):
+        self._disponibles.acquire()
+        con = None
+        try:
+            try:
+                con = self._libres.get_nowait()
+                con.ping(reconnect=True)
+            except queue.Empty:
+                con = self._conectar()
+            yield con
+        except BaseException:
+            # Conexión en estado desconocido (cursor a medio leer, red caída): se descarta
+            if con is not None:
+                con.close()
+                con = None
+            raise
+        finally:
+            if con is not None:
+                self._libres.put(con)
+            self._disponibles.release()
+
+
+_pool = None
+_lock = threading.Lock()
+
+
+def obtener_pool() -> _Pool:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = _Pool(TAMANIO_POOL)
+    return _pool
+
+
+def _fecha(yymmdd: str):
+    if FECHAS == "date":
+        return datetime.strptime(yymmdd, "%y%m%d").date()
+    return yymmdd
+
+
+def _argumentos(params: dict) -> dict:
+    # Mismos params que la API (fechas aammdd) -> valores para la consulta
+    args = {"desde": _fecha(params["desde"]), "hasta": _fecha(params["hasta"])}
+    if params.get("contribuyente"):
+        texto = params["contribuyente"].replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        args["contribuyente"] = f"%{texto}%"
+    return args
+
+
+def _sql(endpoint: str, params: dict) -> str:
+    sql = CONSULTAS[endpoint]
+    if "limit" in params:
+        # Modo paginado (API_PAGINADO=1)
+        sql += f" LIMIT {int(params['limit'])} OFFSET {int(params.get('offset', 0))}"
+    return sql
+
+
+def iterar_filas(endpoint: str, params=None):
+    # Equivalente a cliente_api.iterar_filas: filas una por una, sin tenerlas todas
+    params = params or {}
+    with obtener_pool().conexion() as con:
+        with con.cursor(pymysql.cursors.SSDictCursor) as cursor:
+            cursor.execute(_sql(endpoint, params), _argumentos(params))
+            while True:
+                lote = cursor.fetchmany(TAMANIO_LOTE)
+                if not lote:
+                    return
+                yield from lote
+
+
+def _tamanio(filas) -> int:
+    # Aproximado, para los límites de la caché: se mide una muestra
+    muestra = filas[:100]
+    if not muestra:
+        return 0
+    por_fila = sum(sys.getsizeof(v) for f in muestra for v in f.values()) / len(muestra)
+    return int(por_fila * len(filas))
+
+
+def get_json(endpoint: str, params=None, decodificar=None):
+    # Equivalente a cliente_api.get_json: (datos, tamanio)
+    with metricas.medir("mysql", endpoint=endpoint) as m:
+        filas = list(iterar_filas(endpoint, params))
+        m.datos["filas"] = len(filas)
+    tamanio = _tamanio(filas)
+    if endpoint in OBJETOS:
+        return (filas[0] if filas else {}), tamanio
+    if decodificar is not None:
+        with metricas.medir("decodificar", endpoint=endpoint, filas=len(filas)):
+            filas = decodificar(filas)
+    return filas, tamanio
+
+
+def cerrar():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            while True:
+                try:
+                    _pool._libres.get_nowait().close()
+                except queue.Empty:
+                    break
+            _pool = None
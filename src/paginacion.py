@@ -0,0 +1,145 @@
+import asyncio
+import os
+
+import cliente_api
+
+# Con API_PAGINADO=1 se piden solo las filas de la página visible usando
+# offset/limit; si el backend ignora esos parámetros se usa la respuesta
+# completa (decodificada en streaming por cliente_api).
+PAGINADO = os.getenv("API_PAGINADO", "0") == "1"
+
+
+class OffsetIgnorado(Exception):
+    """El backend respeta limit pero no offset: no se puede leer más allá del primer lote."""
+
+
+def iterar_registros(endpoint: str, params: dict, decodificar, tamanio_lote: int = 500):
+    # Generador (bloqueante, para usar en un hilo) que recorre todo el
+    # resultado de una consulta por lotes, sin tenerlo completo en memoria.
+    if not PAGINADO:
+        lote = []
+        for fila in cliente_api.iterar_filas(endpoint, params):
+            lote.append(fila)
+            if len(lote) >= tamanio_lote:
+                yield from decodificar(lote)
+                lote = []
+        yield from decodificar(lote)
+        return
+
+    offset = 0
+    primera = None
+    while True:
+        params_lote = dict(params, offset=offset, limit=tamanio_lote)
+        data, _ = cliente_api.get_json(endpoint, params_lote)
+        filas = data.get("items", []) if isinstance(data, dict) else data
+        if offset and filas and filas[0] == primera:
+            # El backend respeta limit pero ignora offset: repetiría el primer
+            # lote. Cortar aquí dejaría una exportación incompleta que parece buena.
+            raise OffsetIgnorado(f"{endpoint}: el servidor ignora offset, solo se pueden leer {offset} filas")
+        if not offset and filas:
+            primera = filas[0]
+        yield from decodificar(filas)
+        if len(filas) != tamanio_lote:
+            # Última página, o el backend ignoró offset/limit y mandó todo
+            return
+        offset += tamanio_lote
+
+
+class ConsultaPaginada:
+    """Resultados de una consulta que se van trayendo página por página."""
+
+    def __init__(self, endpoint: str, params: dict, tamanio_pagina: int, decodificar=None):
+        self.endpoint = endpoint
+        self.decodificar = decodificar
+        self.params = dict(params)
+        self.tamanio_pagina = tamanio_pagina
+        self.total = None          # lo informa el backend si lo sabe
+        self.todos = None          # respuesta completa si el backend no pagina
+        self._paginas = {}         # indice -> filas (solo una ventana pequeña)
+        self._ultima = None        # indice de la última página, cuando se conoce
+        self._pendientes = {}      # indice -> tarea de precarga
+        self._primera = None       # primera fila de la página 0, para detectar offset ignorado
+        self._respuesta0 = None    # filas de la página 0 tal como llegaron (limit + 1)
+
+    @property
+    def completo(self) -> bool:
+        # True cuando todas las filas de la consulta están en memoria
+        return self.todos is not None
+
+    async def _traer(self, n: int):
+        params = dict(self.params)
+        params["offset"] = n * self.tamanio_pagina
+        params["limit"] = self.tamanio_pagina + 1  # una de más para saber si hay siguiente
+        data = await cliente_api.consultar(self.endpoint, params)
+
+        if isinstance(data, dict):
+            filas = data.get("items", [])
+            if data.get("total") is not None:
+                self.total = int(data["total"])
+        else:
+            filas = data
+        recibidas = len(filas)  # antes de descartar filas inválidas
+        if n == 0 and filas:
+            self._primera = filas[0]
+        elif n > 0 and filas and filas[0] == self._primera:
+            # Offset ignorado: pedir más solo repetiría la página 0. Lo que
+            # llegó con ella (incluida la fila de más) es todo lo que hay y
+            # se pagina en memoria.
+            print(f"{self.endpoint}: el servidor ignora offset, se usan las "
+                  f"{len(self._respuesta0)} filas de la primera respuesta")
+            self.todos = self._respuesta0
+            self.total = len(self.todos)
+            return
+        if self.decodificar is not None:
+            filas = await asyncio.to_thread(self.decodificar, filas)
+        if not isinstance(data, dict) and recibidas > self.tamanio_pagina + 1:
+            # El backend devolvió todo: se pagina en memoria
+            self.todos = filas
+            self.total = len(filas)
+            return
+        if n == 0:
+            self._respuesta0 = filas
+
+        if recibidas <= self.tamanio_pagina:
+            self._ultima = n
+        self._paginas[n] = filas[:self.tamanio_pagina]
+
+    async def cargar(self, n: int):
+        if self.todos is None and n not in self._paginas:
+            tarea = self._pendientes.pop(n, None)
+            if tarea is not None:
+                await tarea
+            else:
+                await self._traer(n)
+
+        # Conservar solo la página anterior, la actual y la siguiente
+        for k in [k for k in self._paginas if abs(k - n) > 1]:
+            del self._paginas[k]
+
+        if self.hay_siguiente(n) and self.todos is None and n + 1 not in self._paginas \
+                and n + 1 not in self._pendientes:
+            self._pendientes[n + 1] = asyncio.create_task(self._precargar(n + 1))
+
+    async def _precargar(self, n: int):
+        try:
+            await self._traer(n)
+        except Exception as e:
+            print("Error al precargar página:", str(e))
+        finally:
+            self._pendientes.pop(n, None)
+
+    def filas(self, n: int) -> list:
+        if self.todos is not None:
+            inicio = n * self.tamanio_pagina
+            return self.todos[inicio:inicio + self.tamanio_pagina]
+        return self._paginas.get(n, [])
+
+    def hay_siguiente(self, n: int) -> bool:
+        if self.todos is not None or self.total is not None:
+            return (n + 1) * self.tamanio_pagina < self.total
+        return self._ultima is None or n < self._ultima
+
+    def cancelar(self):
+        for tarea in self._pendientes.values():
+            tarea.cancel()
+        self._pendientes.clear()
@@ -0,0 +1,110 @@
+import os
+
+import cache_consultas
+import cliente_api
+import modelos
+
+# Modo "hoy" de Recibos: si el rango consultado incluye el día de hoy, cada
+# SEGUIMIENTO_SEGUNDOS se pregunta solo por lo nuevo del día en lugar de
+# repetir la búsqueda completa.
+# - Recibos nuevos: se pide el día con despues_de=<último recibo visto>. Si
+#   el backend no conoce el parámetro manda el día entero y aquí se filtra;
+#   en ambos casos la petición es condicional (ETag), así que sin cambios la
+#   respuesta es un 304 sin cuerpo.
+# - Cancelaciones: con despues_de el backend solo manda lo nuevo, así que se
+#   compara la cantidad de cancelados de recibos/totales del día con la
+#   local y solo si difiere se vuelve a pedir el día completo.
+# Viene apagado (SEGUIMIENTO_SEGUNDOS=0): cada sesión abierta en "hoy" hace
+# una petición por intervalo. Si el backend ignora despues_de y tampoco manda
+# validadores, cada vuelta baja el día completo: la espera se duplica hasta
+# SEGUIMIENTO_MAX_SEGUNDOS y vuelve al intervalo normal cuando deja de pasar.
+
+SEGUNDOS = float(os.getenv("SEGUIMIENTO_SEGUNDOS", "0"))  # 0 = apagado
+MAX_SEGUNDOS = float(os.getenv("SEGUIMIENTO_MAX_SEGUNDOS", "600"))
+ACTIVO = SEGUNDOS > 0
+
+
+def _orden(recibo):
+    # Números de recibo como enteros; uno no numérico (si lo hubiera) va al final
+    return (isinstance(recibo, int), recibo)
+
+
+def incluye_hoy(params) -> bool:
+    return params["desde"] <= cache_consultas.hoy_yymmdd() <= params["hasta"]
+
+
+class SeguimientoHoy:
+    """Recibos de hoy ya vistos y consulta de lo que cambió desde entonces."""
+
+    def __init__(self, params: dict, registros):
+        hoy = cache_consultas.hoy_yymmdd()
+        self.dia = modelos.parse_fecha(hoy)
+        self.params = dict(params, desde=hoy, hasta=hoy)
+        self.endpoint = "recibos/filtrar" if params.get("contribuyente") else "recibos"
+        self.vistos = {r.recibo: r for r in registros if r.fecha == self.dia}  # recibo -> registro
+        self.ultimo = max(self.vistos, key=_orden, default=None)
+        self._validadores = {}  # params (como tupla) -> validadores de la última respuesta
+        self.espera = SEGUNDOS  # segundos hasta la siguiente consulta
+
+    def vigente(self) -> bool:
+        # Pasada la medianoche el día seguido ya quedó cerrado
+        return self.params["hasta"] == cache_consultas.hoy_yymmdd()
+
+    def _pedir(self, endpoint: str, params: dict, decodificar=None):
+        # Devuelve (datos, con_validadores)
+        clave = tuple(sorted(params.items()))
+        datos, _, validadores = cliente_api.pedir(endpoint, params, decodificar, self._validadores.get(clave))
+        if validadores:
+            self._validadores[clave] = validadores
+        return datos, bool(validadores)
+
+    def cancelados(self) -> int:
+        return sum(1 for r in self.vistos.values() if r.cancelado)
+
+    def consultar(self):
+        # Bloqueante (para un hilo). Devuelve (nuevos, cambiados): nuevos del
+        # más reciente al más antiguo y cambiados como (anterior, actual).
+        params = dict(self.params)
+        if self.ultimo is not None:
+            params["despues_de"] = self.ultimo
+        datos, con_validadores = self._pedir(self.endpoint, params, modelos.decodificar_recibos)
+        if datos is cliente_api.NO_MODIFICADO:
+            datos = []
+        completo = any(r.recibo in self.vistos for r in datos)  # el backend ignoró despues_de
+        if completo and not con_validadores:
+            self.espera = min(self.espera * 2, max(MAX_SEGUNDOS, SEGUNDOS))
+        else:
+            self.espera = SEGUNDOS
+        nuevos, cambiados = self._comparar(datos)
+
+        if not completo and self.vistos:
+            totales, _ = self._pedir("recibos/totales", self.params)
+            if totales is not cliente_api.NO_MODIFICADO and \
+                    int(totales.get("cantidad_status_1", 0)) != self.cancelados():
+                datos, _ = self._pedir(self.endpoint, self.params, modelos.decodificar_recibos)
+                if datos is not cliente_api.NO_MODIFICADO:
+                    mas_nuevos, cambiados = self._comparar(datos)
+                    nuevos = mas_nuevos + nuevos
+        nuevos.sort(key=lambda r: _orden(r.recibo), reverse=True)
+        return nuevos, cambiados
+
+    def _comparar(self, datos):
+        # vistos y ultimo se actualizan al final, ya calculado todo
+        nuevos = []
+        cambiados = []
+        for r in datos:
+            anterior = self.vistos.get(r.recibo)
+            if anterior is None:
+                nuevos.append(r)
+            elif anterior.cancelado != r.cancelado:
+                cambiados.append((anterior, r))
+        if nuevos:
+            numeros = [r.recibo for r in nuevos]
+            if self.ultimo is not None:
+                numeros.append(self.ultimo)
+            self.ultimo = max(numeros, key=_orden)
+        for r in nuevos:
+            self.vistos[r.recibo] = r
+        for _, r in cambiados:
+            self.vistos[r.recibo] = r
+        return nuevos, cambiados
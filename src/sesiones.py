@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+
+# Control de memoria por sesión. En modo web cada navegador tiene su propio
+# main() con sus resultados; aquí se lleva la cuenta de cuánto retiene cada
+# sesión y se fijan los límites.
+#
+# SESION_MAX_FILAS: filas que una vista conserva en memoria (0 = sin límite).
+#   Los totales se calculan sobre todo el rango antes de recortar.
+# Las vistas que no se ven conservan sus resultados (volver a ellas no
+# cuesta nada). Se sueltan al desconectarse la sesión, cuando todas las
+# sesiones juntas pasan de SESIONES_LIMITE_MB (0 = sin límite) o siempre con
+# LIBERAR_OCULTAS=1.
+
+MAX_FILAS = int(os.getenv("SESION_MAX_FILAS", "20000"))
+LIBERAR_OCULTAS = os.getenv("LIBERAR_OCULTAS", "0") == "1"
+LIMITE_MB = float(os.getenv("SESIONES_LIMITE_MB", "512"))
+
+MUESTRA = 200  # filas que se miden para estimar el tamaño de un resultado
+MB = 1024 * 1024
+
+
+def excede(registros) -> bool:
+    return MAX_FILAS > 0 and len(registros) > MAX_FILAS
+
+
+def recortar(registros) -> list:
+    return registros[:MAX_FILAS] if excede(registros) else registros
+
+
+def _tamanio_registro(r) -> int:
+    if isinstance(r, dict):
+        # Fila sin decodificar, tal como llega del origen
+        return sys.getsizeof(r) + sum(sys.getsizeof(v) for v in r.values())
+    return sys.getsizeof(r) + sum(sys.getsizeof(getattr(r, campo, None)) for campo in r.__slots__)
+
+
+def tamanio_estimado(registros) -> int:
+    # Bytes aproximados en memoria: se mide una muestra y se extrapola.
+    # Acepta registros de modelos, filas dict o un solo objeto dict.
+    if isinstance(registros, dict):
+        return _tamanio_registro(registros)
+    if not registros:
+        return 0
+    paso = max(1, len(registros) // MUESTRA)
+    muestra = registros[::paso]
+    por_fila = sum(_tamanio_registro(r) for r in muestra) / len(muestra)
+    return int(sys.getsizeof(registros) + por_fila * len(registros))
+
+
+class Sesion:
+    """Lo que retiene una sesión: nombre del conjunto -> (filas, bytes)."""
+
+    def __init__(self, id_sesion: str):
+        self.id = id_sesion
+        self.conjuntos = {}
+
+    @property
+    def bytes(self) -> int:
+        return sum(b for _, b in self.conjuntos.values())
+
+    def registrar(self, nombre: str, registros):
+        registros = registros or []
+        self.conjuntos[nombre] = (len(registros), tamanio_estimado(registros))
+        reportar(self)
+
+    def describir(self) -> str:
+        partes = [f"{nombre}={filas} filas ~{b / MB:.1f} MB" for nombre, (filas, b) in self.conjuntos.items()]
+        return f"sesión {self.id}: " + (", ".join(partes) or "sin datos")
+
+
+_sesiones = {}
+_lock = threading.Lock()
+
+
+def abrir(id_sesion: str) -> Sesion:
+    with _lock:
+        sesion = _sesiones[id_sesion] = Sesion(id_sesion)
+    reportar(sesion)
+    return sesion
+
+
+def cerrar(sesion: Sesion):
+    with _lock:
+        _sesiones.pop(sesion.id, None)
+    print(f"[memoria] {sesion.id} cerrada | {resumen()}")
+
+
+def _total() -> int:
+    with _lock:
+        return sum(s.bytes for s in _sesiones.values())
+
+
+def bajo_presion() -> bool:
+    # True si lo retenido por todas las sesiones pasa del límite
+    return LIMITE_MB > 0 and _total() > LIMITE_MB * MB
+
+
+def resumen() -> str:
+    with _lock:
+        activas = list(_sesiones.values())
+    total = sum(s.bytes for s in activas)
+    return f"total ~{total / MB:.1f} MB en {len(activas)} sesiones"
+
+
+def reportar(sesion: Sesion):
+    print(f"[memoria] {sesion.describir()} | {resumen()}")
@@ -0,0 +1,132 @@
+from decimal import Decimal
+
+from modelos import CERO, parse_monto
+
+# Totales calculados en el cliente a partir de los registros ya descargados
+# (modelos.Recibo / modelos.Cedula). Se recorre la lista una sola vez; los montos se suman
+# como Decimal para que cuadren al centavo con los del servidor.
+
+# Los recibos cancelados se cuentan pero no suman a neto/descuento. Es lo que
+# se supone que hace recibos/totales del servidor (total_neto sin cancelados,
+# cantidad_status_1 = cancelados); no está documentado en la API, así que
+# cuando se tienen los dos se comparan con diferencias() y se avisa en el log.
+EXCLUIR_CANCELADOS = True
+CENTAVO = Decimal("0.01")
+
+
+class TotalesRecibos:
+    __slots__ = ("total_neto", "total_descuento", "cantidad", "cancelados", "por_cuenta")
+
+    def __init__(self):
+        self.total_neto = CERO
+        self.total_descuento = CERO
+        self.cantidad = 0
+        self.cancelados = 0
+        self.por_cuenta = {}  # cuenta -> [neto, descuento]
+
+    def agregar(self, r):
+        self.cantidad += 1
+        if r.cancelado:
+            self.cancelados += 1
+            if EXCLUIR_CANCELADOS:
+                return
+        self.total_neto += r.neto
+        self.total_descuento += r.descuento
+        acumulado = self.por_cuenta.get(r.cuenta)
+        if acumulado is None:
+            self.por_cuenta[r.cuenta] = [r.neto, r.descuento]
+        else:
+            acumulado[0] += r.neto
+            acumulado[1] += r.descuento
+
+    def quitar(self, r):
+        # Inverso de agregar: para cambios puntuales (p. ej. un recibo que se
+        # cancela) sin recorrer otra vez toda la lista
+        self.cantidad -= 1
+        if r.cancelado:
+            self.cancelados -= 1
+            if EXCLUIR_CANCELADOS:
+                return
+        self.total_neto -= r.neto
+        self.total_descuento -= r.descuento
+        acumulado = self.por_cuenta[r.cuenta]
+        acumulado[0] -= r.neto
+        acumulado[1] -= r.descuento
+
+    def tiene_cuentas(self) -> bool:
+        # Si la API no manda "cuenta" en las filas no se puede desglosar
+        return any(cuenta is not None for cuenta in self.por_cuenta)
+
+    def despliegue(self) -> list:
+        # Mismo formato que recibos/totales/despliegue
+        return [
+            {"cuenta": cuenta if cuenta is not None else "Sin cuenta",
+             "total_neto": neto, "total_descuento": descuento}
+            for cuenta, (neto, descuento) in sorted(self.por_cuenta.items(), key=lambda kv: str(kv[0]))
+        ]
+
+
+def diferencias(t: TotalesRecibos, servidor: dict) -> list:
+    # Lo que no cuadra entre los totales locales y los de recibos/totales
+    avisos = []
+    for campo, local in (("total_neto", t.total_neto), ("total_descuento", t.total_descuento)):
+        remoto = parse_monto(servidor.get(campo))
+        if abs(remoto - local) >= CENTAVO:
+            avisos.append(f"{campo}: servidor {remoto}, local {local}")
+    cancelados = int(servidor.get("cantidad_status_1", 0))
+    if cancelados != t.cancelados:
+        avisos.append(f"cancelados: servidor {cancelados}, local {t.cancelados}")
+    return avisos
+
+
+def totales_recibos(registros) -> TotalesRecibos:
+    t = TotalesRecibos()
+    for r in registros:
+        t.agregar(r)
+    return t
+
+
+class TotalesCedulas:
+    __slots__ = ("cantidad", "importe", "pagadas", "importe_pagadas", "por_motivo")
+
+    def __init__(self):
+        self.cantidad = 0
+        self.importe = CERO
+        self.pagadas = 0
+        self.importe_pagadas = CERO
+        self.por_motivo = {}  # motivo -> [cantidad, importe]
+
+    @property
+    def pendientes(self) -> int:
+        return self.cantidad - self.pagadas
+
+    @property
+    def importe_pendientes(self):
+        return self.importe - self.importe_pagadas
+
+    def agregar(self, c):
+        self.cantidad += 1
+        self.importe += c.importe
+        if c.pagada:
+            self.pagadas += 1
+            self.importe_pagadas += c.importe
+        acumulado = self.por_motivo.get(c.motivo)
+        if acumulado is None:
+            self.por_motivo[c.motivo] = [1, c.importe]
+        else:
+            acumulado[0] += 1
+            acumulado[1] += c.importe
+
+    def despliegue(self) -> list:
+        # [(motivo, cantidad, importe)] de mayor a menor importe
+        return sorted(
+            ((motivo or "Sin motivo", n, importe) for motivo, (n, importe) in self.por_motivo.items()),
+            key=lambda x: x[2], reverse=True
+        )
+
+
+def totales_cedulas(registros) -> TotalesCedulas:
+    t = TotalesCedulas()
+    for c in registros:
+        t.agregar(c)
+    return t
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+import cliente_api
+
+# Rangos de fechas largos se piden por tramos (semanas, por defecto) en
+# paralelo, con un máximo de pedidos simultáneos. Los tramos se juntan en
+# orden de fecha y se van entregando conforme se completan, así la lista se
+# llena poco a poco. Los límites de tramo son fijos en el calendario (lunes a
+# domingo con TRAMO_DIAS=7), de modo que dos consultas que se enciman piden
+# los mismos tramos y los históricos salen de la caché.
+
+DIAS_TRAMO = int(os.getenv("TRAMO_DIAS", "7"))
+MAX_PARALELO = int(os.getenv("TRAMOS_PARALELO", "4"))
+
+# Endpoints que devuelven filas por fecha y se pueden partir sin cambiar el resultado
+ENDPOINTS = {"recibos", "recibos/filtrar", "cedulas", "cedulas/filtrar"}
+
+_ORIGEN = date(2000, 1, 3)  # lunes: alinea los tramos de 7 días con las semanas
+
+
+def _dia(yymmdd: str) -> date:
+    return datetime.strptime(yymmdd, "%y%m%d").date()
+
+
+def dividir(desde: date, hasta: date, dias: int = DIAS_TRAMO) -> list:
+    # [(inicio, fin)] que cubren desde..hasta, cortados en la rejilla fija
+    tramos = []
+    inicio = desde
+    while inicio <= hasta:
+        fin = inicio + timedelta(days=dias - 1 - (inicio - _ORIGEN).days % dias)
+        tramos.append((inicio, min(fin, hasta)))
+        inicio = fin + timedelta(days=1)
+    return tramos
+
+
+def params_tramo(params: dict, inicio: date, fin: date) -> dict:
+    return dict(params, desde=inicio.strftime("%y%m%d"), hasta=fin.strftime("%y%m%d"))
+
+
+async def consultar(endpoint: str, params: dict, cache=None, forzar: bool = False, decodificar=None,
+                    al_avanzar=None) -> list:
+    # Igual que cliente_api.consultar pero por tramos. al_avanzar(filas)
+    # recibe lo acumulado (en orden) cada vez que se completa el tramo que
+    # sigue; se llama desde el loop. Los endpoints que no están en ENDPOINTS
+    # (totales, despliegue) no se pueden juntar por tramos: van en un solo pedido.
+    tramos = dividir(_dia(params["desde"]), _dia(params["hasta"]))
+    if endpoint not in ENDPOINTS or len(tramos) == 1:
+        return await cliente_api.consultar(endpoint, params, cache, forzar, decodificar)
+
+    limite = asyncio.Semaphore(MAX_PARALELO)
+
+    async def traer(inicio, fin):
+        async with limite:
+            return await cliente_api.consultar(endpoint, params_tramo(params, inicio, fin), cache, forzar,
+                                               decodificar)
+
+    tareas = [asyncio.ensure_future(traer(inicio, fin)) for inicio, fin in tramos]
+    filas = []
+    try:
+        for tarea in tareas:
+            filas.extend(await tarea)
+            if al_avanzar is not None and tarea is not tareas[-1]:
+                al_avanzar(filas[:])
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+    return filas
+
+
+_ejecutor = None
+_lock = threading.Lock()
+
+
+def ejecutor() -> ThreadPoolExecutor:
+    # Hilos para descargar tramos desde código bloqueante (almacén local).
+    # Es uno por proceso: el límite vale para todas las sesiones juntas.
+    global _ejecutor
+    if _ejecutor is None:
+        with _lock:
+            if _ejecutor is None:
+                _ejecutor = ThreadPoolExecutor(MAX_PARALELO, thread_name_prefix="tramos")
+    return _ejecutor
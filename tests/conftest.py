@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Los módulos de la app se importan como en src/main.py (sin paquete)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,179 @@
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+
+import almacen_local
+import cliente_api
+import modelos
+import origen_mysql
+
+
+def _fila(recibo):
+    return {"recibo": recibo, "contribuyente": "JUAN PEREZ", "concepto": "PREDIAL",
+            "fecha": date(2024, 1, 2), "neto": Decimal("10.50"), "descuento": Decimal("0"),
+            "cuenta": "4110", "status": 0}
+
+
+class CursorFalso:
+    def __init__(self, con):
+        self.con = con
+        self.filas = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, args):
+        self.con.consultas.append((sql, args))
+        if self.con.falla:
+            raise RuntimeError("conexión perdida")
+        self.filas = list(self.con.filas)
+
+    def fetchmany(self, n):
+        self.con.lotes.append(n)
+        lote, self.filas = self.filas[:n], self.filas[n:]
+        return lote
+
+
+class ConexionFalsa:
+    def __init__(self, filas):
+        self.filas = filas
+        self.falla = False
+        self.cerrada = False
+        self.pings = 0
+        self.consultas = []
+        self.lotes = []
+
+    def cursor(self, clase):
+        return CursorFalso(self)
+
+    def ping(self, reconnect=False):
+        self.pings += 1
+
+    def close(self):
+        self.cerrada = True
+
+
+@pytest.fixture
+def base(monkeypatch):
+    # Cada pymysql.connect() crea una ConexionFalsa con las filas de base.filas
+    class Base:
+        filas = []
+        conexiones = []
+
+    def conectar(**kwargs):
+        con = ConexionFalsa(Base.filas)
+        Base.conexiones.append(con)
+        return con
+
+    monkeypatch.setattr(origen_mysql.pymysql, "connect", conectar)
+    monkeypatch.setattr(origen_mysql, "_pool", None)
+    monkeypatch.setattr(cliente_api, "ORIGEN", "mysql")
+    yield Base
+    origen_mysql.cerrar()
+
+
+def test_fechas_aammdd_por_defecto(base):
+    origen_mysql.get_json("recibos", {"desde": "240101", "hasta": "240107"})
+    sql, args = base.conexiones[0].consultas[0]
+    assert "BETWEEN %(desde)s AND %(hasta)s" in sql
+    assert args == {"desde": "240101", "hasta": "240107"}
+
+
+def test_fechas_date_configurable(base, monkeypatch):
+    monkeypatch.setattr(origen_mysql, "FECHAS", "date")
+    origen_mysql.get_json("recibos", {"desde": "240101", "hasta": "240107"})
+    _, args = base.conexiones[0].consultas[0]
+    assert args == {"desde": date(2024, 1, 1), "hasta": date(2024, 1, 7)}
+
+
+def test_filtro_escapa_comodines(base):
+    origen_mysql.get_json("recibos/filtrar", {"desde": "240101", "hasta": "240107", "contribuyente": "50%_a\\b"})
+    sql, args = base.conexiones[0].consultas[0]
+    assert "LIKE %(contribuyente)s" in sql
+    assert args["contribuyente"] == "%50\\%\\_a\\\\b%"
+
+
+def test_paginado_agrega_limit_offset(base):
+    origen_mysql.get_json("recibos", {"desde": "240101", "hasta": "240107", "offset": 500, "limit": 100})
+    sql, _ = base.conexiones[0].consultas[0]
+    assert sql.endswith(" LIMIT 100 OFFSET 500")
+
+
+def test_lee_por_lotes_y_decodifica(base):
+    base.filas = [_fila(i) for i in range(2500)]
+    registros, tamanio = cliente_api.get_json("recibos", {"desde": "240101", "hasta": "240107"},
+                                              modelos.decodificar_recibos)
+    assert len(registros) == 2500
+    assert registros[0].neto == Decimal("10.50") and registros[0].fecha == date(2024, 1, 2)
+    assert tamanio > 0
+    assert base.conexiones[0].lotes == [origen_mysql.TAMANIO_LOTE] * 4
+
+
+def test_columnas_datetime_al_almacen_local(base, monkeypatch, tmp_path):
+    # DB_FECHAS=date con columnas DATETIME: las filas traen datetime, no date
+    monkeypatch.setattr(origen_mysql, "FECHAS", "date")
+    base.filas = [dict(_fila(i), fecha=datetime(2024, 1, 2, 9, i)) for i in range(3)]
+    registros, _ = cliente_api.get_json("recibos", {"desde": "240101", "hasta": "240107"},
+                                        modelos.decodificar_recibos)
+    assert [r.fecha for r in registros] == [date(2024, 1, 2)] * 3
+
+    almacen = almacen_local.AlmacenLocal(str(tmp_path / "datos.sqlite3"))
+    almacen.guardar("recibos", date(2024, 1, 1), date(2024, 1, 7), registros, cerrado=True)
+    leidos = almacen.leer("recibos", date(2024, 1, 1), date(2024, 1, 7))
+    assert [r.recibo for r in leidos] == [0, 1, 2]
+    assert almacen.dias_faltantes("recibos", date(2024, 1, 1), date(2024, 1, 7)) == []
+
+
+def test_totales_devuelve_un_objeto(base):
+    base.filas = [{"total_neto": Decimal("5"), "total_descuento": Decimal("0"), "cantidad_status_1": 1}]
+    datos, _ = origen_mysql.get_json("recibos/totales", {"desde": "240101", "hasta": "240107"})
+    assert datos["cantidad_status_1"] == 1
+
+
+def test_pool_reutiliza_conexion(base):
+    params = {"desde": "240101", "hasta": "240107"}
+    origen_mysql.get_json("recibos", params)
+    origen_mysql.get_json("cedulas", params)
+    assert len(base.conexiones) == 1
+    assert base.conexiones[0].pings == 1
+
+
+def test_pool_descarta_conexion_con_error(base):
+    params = {"desde": "240101", "hasta": "240107"}
+    origen_mysql.get_json("recibos", params)
+    base.conexiones[0].falla = True
+    with pytest.raises(RuntimeError):
+        origen_mysql.get_json("recibos", params)
+    assert base.conexiones[0].cerrada
+    origen_mysql.get_json("recibos", params)
+    assert len(base.conexiones) == 2
+
+
+def test_totales_sql_cuadran_con_los_locales():
+    # La consulta es SQL estándar: se corre en SQLite con filas de status NULL
+    import re
+    import sqlite3
+
+    import totales
+
+    filas = [
+        dict(_fila(1), neto=Decimal("100"), status=0),
+        dict(_fila(2), neto=Decimal("50"), status=None),
+        dict(_fila(3), neto=Decimal("999"), status=1),
+    ]
+    con = sqlite3.connect(":memory:")
+    con.execute("CREATE TABLE recibos (recibo, contribuyente, concepto, fecha, neto, descuento, cuenta, status)")
+    con.executemany("INSERT INTO recibos VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(f["recibo"], f["contribuyente"], f["concepto"], "240102", float(f["neto"]),
+                      float(f["descuento"]), f["cuenta"], f["status"]) for f in filas])
+    sql = re.sub(r"%\((\w+)\)s", r":\1", origen_mysql.CONSULTAS["recibos/totales"])
+    con.row_factory = sqlite3.Row
+    servidor = dict(con.execute(sql, {"desde": "240101", "hasta": "240107"}).fetchone())
+
+    local = totales.totales_recibos(modelos.decodificar_recibos(filas))
+    assert totales.diferencias(local, servidor) == []
+    assert servidor["cantidad_status_1"] == 1
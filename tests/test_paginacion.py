@@ -0,0 +1,45 @@
+import asyncio
+
+import pytest
+
+import cliente_api
+import paginacion
+
+
+def _servidor_sin_offset(monkeypatch, total):
+    # Respeta limit pero ignora offset: siempre manda las primeras filas
+    filas = [{"recibo": i} for i in range(total)]
+
+    async def consultar(endpoint, params, *args):
+        return filas[:params["limit"]]
+
+    monkeypatch.setattr(cliente_api, "consultar", consultar)
+
+
+def test_offset_ignorado_usa_la_primera_respuesta(monkeypatch):
+    _servidor_sin_offset(monkeypatch, 101)
+    consulta = paginacion.ConsultaPaginada("recibos", {}, 100)
+
+    async def recorrer():
+        await consulta.cargar(0)
+        assert len(consulta.filas(0)) == 100
+        assert consulta.hay_siguiente(0)
+        await consulta.cargar(1)
+
+    asyncio.run(recorrer())
+    # La fila 101 llegó con la página 0 y se muestra en la página 1
+    assert consulta.filas(1) == [{"recibo": 100}]
+    assert not consulta.hay_siguiente(1)
+    assert consulta.total == 101
+
+
+def test_exportacion_falla_si_se_ignora_offset(monkeypatch):
+    filas = [{"recibo": i} for i in range(1200)]
+    monkeypatch.setattr(paginacion, "PAGINADO", True)
+    monkeypatch.setattr(cliente_api, "get_json", lambda endpoint, params: (filas[:params["limit"]], 0))
+
+    leidas = []
+    with pytest.raises(paginacion.OffsetIgnorado):
+        for fila in paginacion.iterar_registros("recibos", {}, lambda lote: lote):
+            leidas.append(fila)
+    assert len(leidas) == 500
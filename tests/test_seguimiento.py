@@ -0,0 +1,96 @@
+from datetime import datetime
+
+import almacen_local
+import cache_consultas
+import cliente_api
+import modelos
+import seguimiento
+
+
+def _fila(recibo, dia, status=0):
+    return {"recibo": recibo, "contribuyente": "JUAN PEREZ", "concepto": "PREDIAL", "fecha": dia,
+            "neto": "100.00", "descuento": "0", "cuenta": "4110", "status": status}
+
+
+class ApiFalsa:
+    """Recibos de hoy que van llegando; ignora despues_de y no manda validadores."""
+
+    def __init__(self, dia, recibos):
+        self.dia = dia
+        self.filas = [_fila(n, dia) for n in recibos]
+        self.pedidos = []
+
+    def get_json_compartido(self, endpoint, params=None, decodificar=None, forzar=False, cache=None):
+        return decodificar(self.filas), 0
+
+    def pedir(self, endpoint, params, decodificar=None, validadores=None):
+        self.pedidos.append((endpoint, dict(params)))
+        if endpoint == "recibos/totales":
+            cancelados = sum(1 for f in self.filas if f["status"] == 1)
+            return {"cantidad_status_1": cancelados}, 0, None
+        return decodificar(self.filas), 0, None
+
+
+def test_seguimiento_sobre_el_almacen_local(tmp_path, monkeypatch):
+    hoy = cache_consultas.hoy_yymmdd()
+    api = ApiFalsa(hoy, [998, 999])
+    monkeypatch.setattr(cliente_api, "get_json_compartido", api.get_json_compartido)
+    monkeypatch.setattr(cliente_api, "pedir", api.pedir)
+    monkeypatch.setattr(seguimiento, "SEGUNDOS", 30)
+
+    # El almacén guarda el recibo como texto: al leerlo tiene que volver como número
+    almacen = almacen_local.AlmacenLocal(str(tmp_path / "datos.sqlite3"))
+    params = {"desde": hoy, "hasta": hoy}
+    registros, completo = almacen.consultar("recibos", params)
+    assert completo
+    assert [r.recibo for r in registros] == [998, 999]
+
+    seg = seguimiento.SeguimientoHoy(params, registros)
+    assert seg.ultimo == 999
+
+    # 1000 es mayor que 999 aunque como texto sea menor
+    api.filas.append(_fila(1000, hoy))
+    nuevos, cambiados = seg.consultar()
+    assert [r.recibo for r in nuevos] == [1000]
+    assert cambiados == []
+    assert seg.ultimo == 1000
+    assert api.pedidos[-1][1]["despues_de"] == 999
+    # Mandó el día completo sin validadores: se espera más para la siguiente
+    assert seg.espera == 60
+
+    api.filas[0]["status"] = 1
+    api.filas += [_fila(1001, hoy), _fila(1002, hoy)]
+    nuevos, cambiados = seg.consultar()
+    assert [r.recibo for r in nuevos] == [1002, 1001]
+    assert [(a.recibo, a.cancelado, b.cancelado) for a, b in cambiados] == [(998, False, True)]
+    assert seg.ultimo == 1002
+    assert len(seg.vistos) == 5
+    assert seg.espera == 120
+
+
+def test_espera_normal_si_el_backend_filtra(monkeypatch):
+    hoy = cache_consultas.hoy_yymmdd()
+    api = ApiFalsa(hoy, [998, 999])
+
+    def pedir(endpoint, params, decodificar=None, validadores=None):
+        if "despues_de" not in params:
+            return api.pedir(endpoint, params, decodificar)
+        filas = [f for f in api.filas if f["recibo"] > params["despues_de"]]
+        return decodificar(filas), 0, {"ETag": '"1"'}
+
+    monkeypatch.setattr(cliente_api, "pedir", pedir)
+    monkeypatch.setattr(seguimiento, "SEGUNDOS", 30)
+    registros = modelos.decodificar_recibos(api.filas)
+    seg = seguimiento.SeguimientoHoy({"desde": hoy, "hasta": hoy}, registros)
+    api.filas.append(_fila(1000, hoy))
+    nuevos, _ = seg.consultar()
+    assert [r.recibo for r in nuevos] == [1000]
+    assert seg.espera == 30
+
+
+def test_fecha_del_dia_seguido():
+    hoy = cache_consultas.hoy_yymmdd()
+    seg = seguimiento.SeguimientoHoy({"desde": "240101", "hasta": hoy}, [])
+    assert seg.dia == datetime.strptime(hoy, "%y%m%d").date()
+    assert seg.vigente()
+    assert seg.ultimo is None
@@ -0,0 +1,26 @@
+import modelos
+import totales
+
+
+def _recibos():
+    filas = [
+        {"recibo": 1, "fecha": "240102", "neto": "100.00", "descuento": "10.00", "cuenta": "4110", "status": 0},
+        {"recibo": 2, "fecha": "240102", "neto": "50.50", "descuento": "0", "cuenta": "4120"},
+        {"recibo": 3, "fecha": "240102", "neto": "999.00", "descuento": "1.00", "cuenta": "4110", "status": 1},
+    ]
+    return modelos.decodificar_recibos(filas)
+
+
+def test_cancelados_no_suman():
+    t = totales.totales_recibos(_recibos())
+    assert (t.cantidad, t.cancelados) == (3, 1)
+    assert t.total_neto == modelos.parse_monto("150.50")
+    assert t.total_descuento == modelos.parse_monto("10.00")
+
+
+def test_diferencias_con_recibos_totales():
+    t = totales.totales_recibos(_recibos())
+    assert totales.diferencias(t, {"total_neto": 150.5, "total_descuento": "10", "cantidad_status_1": 1}) == []
+    # Un servidor que sí sumara los cancelados
+    avisos = totales.diferencias(t, {"total_neto": "1149.50", "total_descuento": "11.00", "cantidad_status_1": 1})
+    assert [a.split(":")[0] for a in avisos] == ["total_neto", "total_descuento"]